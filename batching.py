@@ -0,0 +1,66 @@
+import numpy as np
+from tqdm import tqdm
+from typing import List, Callable
+
+
+class BatchingStats:
+
+    def __init__(self):
+        self.batches: int = 0
+        self.tokens: int = 0
+        self.padded_tokens: int = 0
+        self.fixed_padded_tokens: int = 0
+
+    def update(self, lengths: np.ndarray, batches: List[np.ndarray], fixed_batch_size: int) -> None:
+        self.batches += len(batches)
+        self.tokens += int(lengths.sum())
+        self.padded_tokens += sum(len(batch) * int(lengths[batch].max()) for batch in batches)
+        # padding of the input-order batching with fixed number of rows, for comparison
+        self.fixed_padded_tokens += sum(len(lengths[i:i + fixed_batch_size]) * int(lengths[i:i + fixed_batch_size].max())
+                                        for i in range(0, len(lengths), fixed_batch_size))
+
+    def get_efficiency(self) -> float:
+        return self.tokens / self.padded_tokens if self.padded_tokens > 0 else 1.0
+
+    def get_fixed_efficiency(self) -> float:
+        return self.tokens / self.fixed_padded_tokens if self.fixed_padded_tokens > 0 else 1.0
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def __str__(self) -> str:
+        return f"{self.batches} batches, {self.tokens} tokens, padding efficiency {self.get_efficiency():.1%} " \
+               f"(fixed-size batches: {self.get_fixed_efficiency():.1%})"
+
+
+class TokenBudgetBatcher:
+
+    def __init__(self, max_tokens: int, length_fn: Callable[[List[str]], List[int]], max_batch_size: int = None):
+        self.max_tokens = max_tokens
+        self.length_fn = length_fn
+        self.max_batch_size = max_batch_size
+        self.stats = BatchingStats()
+
+    def create_batches(self, sentences: List[str], fixed_batch_size: int = 32) -> List[np.ndarray]:
+        lengths = np.asarray(self.length_fn(sentences), dtype=np.int64)
+        order = np.argsort(-lengths, kind='stable')
+        batches, start = [], 0
+        while start < len(order):
+            # sentences are sorted by length (descending), so the first one determines the padded length
+            size = max(1, self.max_tokens // max(int(lengths[order[start]]), 1))
+            if self.max_batch_size is not None:
+                size = min(size, self.max_batch_size)
+            batches.append(order[start:start + size])
+            start += size
+        self.stats.update(lengths, batches, fixed_batch_size)
+        return batches
+
+    def encode(self, sentences: List[str], encode_fn: Callable[[List[str]], np.ndarray],
+               fixed_batch_size: int = 32) -> np.ndarray:
+        embeddings = None
+        for batch in tqdm(self.create_batches(sentences, fixed_batch_size)):
+            batch_embeddings = np.asarray(encode_fn([sentences[i] for i in batch]))
+            if embeddings is None:
+                embeddings = np.empty((len(sentences),) + batch_embeddings.shape[1:], dtype=batch_embeddings.dtype)
+            embeddings[batch] = batch_embeddings
+        return embeddings if embeddings is not None else np.empty((0, 0), dtype=np.float32)
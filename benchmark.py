@@ -0,0 +1,188 @@
+import sys
+import glob
+import json
+import mteb
+import logging
+import resource
+import numpy as np
+import multiprocessing
+from time import perf_counter
+from typing import List, Dict, Optional
+from dataclasses import dataclass, field, replace
+from concurrent.futures import ProcessPoolExecutor
+from transformers import HfArgumentParser
+from models import ModelInfo, ModelWrapper, create_model, get_tokenizer
+from tasks.tasks import get_task_texts, get_retrieval_texts
+from utils import from_dict
+
+# Words used to build synthetic texts, so that tokenizers and lemmatizers see real Polish words.
+SYNTHETIC_WORDS = [
+    'badanie', 'wyniki', 'analiza', 'model', 'język', 'polski', 'dane', 'system', 'metoda', 'praca', 'nowy',
+    'rozwój', 'proces', 'ocena', 'wpływ', 'zastosowanie', 'struktura', 'informacja', 'czas', 'miasto', 'kraj',
+    'rząd', 'prawo', 'szkoła', 'uczeń', 'książka', 'historia', 'kultura', 'muzyka', 'sport', 'zdrowie', 'leczenie',
+    'choroba', 'pacjent', 'lekarz', 'firma', 'rynek', 'cena', 'klient', 'produkt', 'energia', 'woda', 'ziemia',
+    'środowisko', 'zmiana', 'klimat', 'technologia', 'komputer', 'sieć', 'internet', 'użytkownik', 'dzień', 'rok',
+    'jest', 'został', 'może', 'pokazuje', 'opisuje', 'dotyczy', 'oraz', 'który', 'w', 'na', 'z', 'do', 'i', 'że'
+]
+
+# text sets: (number of words of synthetic texts, task and source of sampled texts)
+TEXT_SETS = {
+    's2s': ((8, 16), 'PlscClusteringS2S.v2', 'texts'),
+    'p2p': ((150, 250), 'PlscClusteringP2P.v2', 'texts'),
+    'passage': ((60, 120), 'SciFact-PL', 'corpus')
+}
+
+
+@dataclass
+class BenchmarkArgs:
+    models_config: str = field(
+        metadata={"help": "Path (or glob pattern) of JSON files with model configs."},
+        default="configs/by_type/*.json"
+    )
+    model: str = field(
+        metadata={"help": "Benchmark only the model with this name."},
+        default=None
+    )
+    text_sets: str = field(
+        metadata={"help": "Comma-separated text sets: s2s (titles), p2p (abstracts), passage (retrieval passages)."},
+        default="s2s,p2p,passage"
+    )
+    sampled: bool = field(
+        metadata={"help": "Sample texts from PL-MTEB tasks instead of generating synthetic ones."},
+        default=False
+    )
+    num_texts: int = field(
+        metadata={"help": "Number of texts in each text set."},
+        default=512
+    )
+    batch_size: int = field(
+        metadata={"help": "Batch size of all models (overrides the batch size of model configs if set)."},
+        default=None
+    )
+    seed: int = field(
+        metadata={"help": "Seed of text generation and sampling."},
+        default=42
+    )
+    output: str = field(
+        metadata={"help": "Path of JSON file with benchmark results."},
+        default="benchmark_results.json"
+    )
+    baseline: str = field(
+        metadata={"help": "Path of JSON file with baseline results. Results worse than the baseline by more than "
+                          "the tolerance are reported as regressions."},
+        default=None
+    )
+    tolerance: float = field(
+        metadata={"help": "Relative tolerance of regression checks."},
+        default=0.1
+    )
+
+
+class EncoderBenchmark:
+
+    def __init__(self, args: BenchmarkArgs):
+        self.args = args
+
+    def run(self) -> int:
+        model_infos = self.load_model_infos()
+        texts = {name: self.create_texts(name) for name in self.args.text_sets.split(',')}
+        results = {}
+        # Each model runs in a new process, so its peak RSS is not affected by previously benchmarked models.
+        context = multiprocessing.get_context("spawn")
+        for model_info in model_infos:
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                results[model_info.model_name] = executor.submit(benchmark_model, model_info, texts,
+                                                                 self.args.batch_size).result()
+            logging.info(f"{model_info.model_name}: {json.dumps(results[model_info.model_name])}")
+
+        regressions = self.compare(results) if self.args.baseline is not None else []
+        with open(self.args.output, "w", encoding="utf-8") as f:
+            json.dump({'settings': {'sampled': self.args.sampled, 'num_texts': self.args.num_texts,
+                                    'batch_size': self.args.batch_size, 'seed': self.args.seed},
+                       'results': results, 'regressions': regressions}, f, ensure_ascii=False, indent=4)
+        for regression in regressions:
+            logging.warning(f"Regression: {regression}")
+        return 1 if regressions else 0
+
+    def load_model_infos(self) -> List[ModelInfo]:
+        model_infos = []
+        for path in sorted(glob.glob(self.args.models_config)):
+            with open(path, "r", encoding="utf-8") as file:
+                model_infos += [from_dict(ModelInfo, model_info) for model_info in json.load(file)]
+        # BM25 has no encoder
+        return [model_info for model_info in model_infos if model_info.model_type != 'BM25'
+                and (self.args.model is None or model_info.model_name == self.args.model)]
+
+    def create_texts(self, name: str) -> List[str]:
+        rng = np.random.default_rng(self.args.seed)
+        (min_words, max_words), task_name, source = TEXT_SETS[name]
+        if not self.args.sampled:
+            return [' '.join(rng.choice(SYNTHETIC_WORDS, size=rng.integers(min_words, max_words + 1)))
+                    for _ in range(self.args.num_texts)]
+        task = mteb.get_task(task_name, languages=["pol"])
+        texts = get_retrieval_texts(task)[1] if source == 'corpus' else get_task_texts(task)
+        return [texts[i] for i in rng.choice(len(texts), size=min(self.args.num_texts, len(texts)), replace=False)]
+
+    def compare(self, results: Dict[str, Dict[str, dict]]) -> List[str]:
+        with open(self.args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)['results']
+        regressions = []
+        for model_name, text_sets in results.items():
+            for text_set, stats in text_sets.items():
+                reference = baseline.get(model_name, {}).get(text_set)
+                if reference is None:
+                    continue
+                checks = [('sentences_per_second', stats['sentences_per_second'] <
+                           reference['sentences_per_second'] * (1 - self.args.tolerance)),
+                          ('p99_latency', stats['p99_latency'] > reference['p99_latency'] * (1 + self.args.tolerance)),
+                          ('peak_rss_mb', stats['peak_rss_mb'] > reference['peak_rss_mb'] * (1 + self.args.tolerance))]
+                regressions += [f"{model_name} / {text_set}: {metric} {reference[metric]:.2f} -> {stats[metric]:.2f}"
+                                for metric, regressed in checks if regressed]
+        return regressions
+
+
+def benchmark_model(model_info: ModelInfo, texts: Dict[str, List[str]],
+                    batch_size: Optional[int] = None) -> Dict[str, dict]:
+    logging.basicConfig(format="%(asctime)s : %(message)s", level=logging.INFO)
+    if batch_size is not None:
+        # the wrapper encodes with the batch size of the model config
+        model_info = replace(model_info, batch_size=batch_size)
+    batch_size = model_info.batch_size or 32
+    model = create_model(model_info)
+    wrapper = ModelWrapper(model, model_info)
+    tokenizer = get_tokenizer(model)
+    results = {}
+    for name, set_texts in texts.items():
+        inputs = ['{}{}'.format(model_info.prefix, text) for text in set_texts]
+        if tokenizer is not None:
+            tokens = sum(len(ids) for ids in tokenizer(inputs, truncation=True,
+                                                       max_length=model_info.max_length)['input_ids'])
+        else:
+            tokens = sum(len(text.split()) for text in inputs)
+        wrapper.encode(set_texts[:batch_size], batch_size=batch_size, show_progress_bar=False)  # warm-up
+        latencies = []
+        for i in range(0, len(set_texts), batch_size):
+            start_time = perf_counter()
+            wrapper.encode(set_texts[i:i + batch_size], batch_size=batch_size, show_progress_bar=False)
+            latencies.append(perf_counter() - start_time)
+        total_time = sum(latencies)
+        results[name] = {
+            'sentences': len(set_texts),
+            'tokens': tokens,
+            'sentences_per_second': len(set_texts) / total_time if total_time > 0 else 0.0,
+            'tokens_per_second': tokens / total_time if total_time > 0 else 0.0,
+            'p50_latency': float(np.percentile(latencies, 50)) if latencies else 0.0,
+            'p99_latency': float(np.percentile(latencies, 99)) if latencies else 0.0,
+            # peak of the model's process so far (ru_maxrss is in kilobytes on Linux)
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(asctime)s : %(message)s", level=logging.INFO)
+    logging.root.setLevel(logging.INFO)
+
+    parser = HfArgumentParser([BenchmarkArgs])
+    args = parser.parse_args_into_dataclasses()[0]
+    sys.exit(EncoderBenchmark(args).run())
@@ -0,0 +1,91 @@
+import numpy as np
+from typing import List, Dict, Tuple
+
+
+# BM25 index over lemmatized documents. Terms get integer ids; posting lists are stored in three NumPy arrays
+# (offsets per term, document ids and precomputed BM25 weights), so a query term costs one slice of each array.
+class BM25Index:
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        self.doc_ids: np.ndarray = np.empty(0, dtype=np.int32)
+        self.weights: np.ndarray = np.empty(0, dtype=np.float32)
+        self.n_documents = 0
+
+    def build(self, documents: List[List[str]]) -> 'BM25Index':
+        self.n_documents = len(documents)
+        term_ids = [np.asarray([self.vocabulary.setdefault(term, len(self.vocabulary)) for term in document],
+                               dtype=np.int64) for document in documents]
+        doc_lengths = np.asarray([len(ids) for ids in term_ids], dtype=np.float32)
+        # (document, term) pairs with term frequencies
+        pairs = np.concatenate([doc_id * len(self.vocabulary) + ids for doc_id, ids in enumerate(term_ids)]) \
+            if term_ids else np.empty(0, dtype=np.int64)
+        pairs, tfs = np.unique(pairs, return_counts=True)
+        docs, terms = np.divmod(pairs, len(self.vocabulary)) if len(self.vocabulary) > 0 else (pairs, pairs)
+
+        order = np.argsort(terms, kind='stable')
+        docs, terms, tfs = docs[order], terms[order], tfs[order].astype(np.float32)
+        dfs = np.bincount(terms, minlength=len(self.vocabulary))
+        self.offsets = np.concatenate([[0], np.cumsum(dfs)])
+        idf = np.log1p((self.n_documents - dfs + 0.5) / (dfs + 0.5)).astype(np.float32)
+        avg_length = max(float(doc_lengths.mean()), 1e-9) if self.n_documents > 0 else 1.0
+        norms = self.k1 * (1 - self.b + self.b * doc_lengths[docs] / avg_length)
+        self.weights = (idf[terms] * tfs * (self.k1 + 1) / (tfs + norms)).astype(np.float32)
+        self.doc_ids = docs.astype(np.int32)
+        return self
+
+    def get_stats(self) -> dict:
+        return {'documents': self.n_documents, 'terms': len(self.vocabulary), 'postings': len(self.doc_ids),
+                'size_mb': (self.offsets.nbytes + self.doc_ids.nbytes + self.weights.nbytes) / 1024 ** 2}
+
+    def search(self, queries: List[List[str]], top_k: int, max_cells: int = 2 ** 25) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(top_k, self.n_documents)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return indices, scores
+        # Queries are batched so that the (queries x candidate documents) score matrix has at most max_cells cells;
+        # the number of candidates of a batch is bounded by its postings.
+        batch, batch_start, batch_postings = [], 0, 0
+        for i, query in enumerate(queries):
+            positions = self._positions(query)
+            if batch and (len(batch) + 1) * min(batch_postings + len(positions), self.n_documents) > max_cells:
+                self._search_batch(batch, batch_start, k, indices, scores)
+                batch, batch_start, batch_postings = [], i, 0
+            batch.append(positions)
+            batch_postings += len(positions)
+        if batch:
+            self._search_batch(batch, batch_start, k, indices, scores)
+        return indices, scores
+
+    def _positions(self, query: List[str]) -> np.ndarray:
+        # positions of the posting lists of unique query terms (a repeated term is scored once)
+        term_ids = np.unique(np.fromiter((self.vocabulary[term] for term in query if term in self.vocabulary),
+                                         dtype=np.int64))
+        if len(term_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(self.offsets[term_id], self.offsets[term_id + 1]) for term_id in term_ids])
+
+    def _search_batch(self, batch: List[np.ndarray], start: int, k: int, indices: np.ndarray,
+                      scores: np.ndarray) -> None:
+        positions = np.concatenate(batch)
+        if len(positions) == 0:
+            return
+        rows = np.repeat(np.arange(len(batch)), [len(query_positions) for query_positions in batch])
+        # only documents containing a query term are scored, with one bincount over (query, candidate) pairs
+        candidates, columns = np.unique(self.doc_ids[positions], return_inverse=True)
+        batch_scores = np.bincount(rows * len(candidates) + columns, weights=self.weights[positions],
+                                   minlength=len(batch) * len(candidates)).astype(np.float32)
+        batch_scores = batch_scores.reshape(len(batch), len(candidates))
+        k = min(k, len(candidates))
+        best = np.argpartition(-batch_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(batch_scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+        # candidates without any term of the query are not returned
+        matched = best_scores > 0
+        indices[start:start + len(batch), :k] = np.where(matched, candidates[best], -1)
+        scores[start:start + len(batch), :k] = np.where(matched, best_scores, -np.inf)
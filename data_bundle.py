@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import mteb
+import types
+import hashlib
+import logging
+import datasets
+from time import time
+from typing import Dict, Optional
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from transformers import HfArgumentParser
+from datasets import Dataset, DatasetDict, load_from_disk
+from tasks.tasks import prepare_tasks
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+@dataclass
+class DataBundleArgs:
+    output_dir: str = field(
+        metadata={"help": "Directory of the bundle, e.g. data_bundles/pl-mteb-v1 (must not exist)."},
+        default=None
+    )
+    tasks: str = field(
+        metadata={"help": "Comma-separated names of tasks to export (all tasks from prepare_tasks() if not set)."},
+        default=None
+    )
+    verify: str = field(
+        metadata={"help": "Verify checksums of all files of an existing bundle instead of exporting one."},
+        default=None
+    )
+
+
+# Loaded (and transformed) datasets of PL-MTEB tasks stored in one directory: datasets in Arrow files written by
+# save_to_disk, other values (e.g. qrels) in JSON files, and a manifest with the nested structure of each task's
+# dataset, dataset revisions and SHA-256 checksums of all files. Datasets are memory-mapped when loaded, so tasks
+# load without network and without parsing.
+class DataBundle:
+
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported data bundle format {self.manifest['format_version']} in {path} "
+                             f"(expected {FORMAT_VERSION}).")
+        self.verify = verify
+
+    @staticmethod
+    def export(tasks, path: str) -> 'DataBundle':
+        if os.path.exists(path):
+            raise ValueError(f"Data bundle {path} already exists.")
+        os.makedirs(path)
+        manifest = {'format_version': FORMAT_VERSION, 'created': datetime.now(timezone.utc).isoformat(),
+                    'mteb_version': mteb.__version__, 'datasets_version': datasets.__version__, 'tasks': {}}
+        for task in tasks:
+            name = task.metadata.name
+            start_time = time()
+            loaded = task.data_loaded
+            if not loaded:
+                task.load_data()
+            files = {}
+            structure = DataBundle._write_node(task.dataset, path, name, files)
+            manifest['tasks'][name] = {'revision': task.metadata.dataset.get('revision'), 'dataset': structure,
+                                       'files': files}
+            if not loaded:
+                task.unload_data()
+            logging.info(f"Exported {name} ({sum(f['size'] for f in files.values()) / 1024 ** 2:.1f} MB) in "
+                         f"{time() - start_time:.1f}s.")
+        with open(os.path.join(path, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return DataBundle(path)
+
+    @staticmethod
+    def _write_node(value, root: str, relative_path: str, files: Dict[str, dict]) -> dict:
+        if isinstance(value, Dataset):
+            value.flatten_indices().save_to_disk(os.path.join(root, relative_path))
+            DataBundle._add_checksums(root, relative_path, files)
+            return {'type': 'dataset', 'path': relative_path}
+        if isinstance(value, DatasetDict) or (isinstance(value, dict) and _contains_dataset(value)):
+            items = {str(key): DataBundle._write_node(item, root, os.path.join(relative_path, _safe_name(key)),
+                                                      files)
+                     for key, item in value.items()}
+            return {'type': 'dataset_dict' if isinstance(value, DatasetDict) else 'dict', 'items': items}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return {'type': 'value', 'value': value}
+        # qrels, top-ranked documents etc. (dicts without datasets are written as one file)
+        json_path = f"{relative_path}.json"
+        os.makedirs(os.path.dirname(os.path.join(root, json_path)), exist_ok=True)
+        with open(os.path.join(root, json_path), 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        DataBundle._add_checksums(root, json_path, files)
+        return {'type': 'json', 'path': json_path}
+
+    @staticmethod
+    def _add_checksums(root: str, relative_path: str, files: Dict[str, dict]) -> None:
+        full_path = os.path.join(root, relative_path)
+        paths = [os.path.join(directory, name) for directory, _, names in os.walk(full_path) for name in names] \
+            if os.path.isdir(full_path) else [full_path]
+        for file_path in paths:
+            files[os.path.relpath(file_path, root)] = {'sha256': _sha256(file_path),
+                                                       'size': os.path.getsize(file_path)}
+
+    def has_task(self, task) -> bool:
+        return task.metadata.name in self.manifest['tasks']
+
+    def attach(self, tasks) -> None:
+        # load_data of bundled tasks reads the bundle (also when called by mteb, prefetching or text collection)
+        for task in tasks:
+            if self.has_task(task):
+                task.load_data = types.MethodType(lambda bound_task, *args, **kwargs: self.load(bound_task), task)
+            else:
+                logging.warning(f"{task.metadata.name} is not in data bundle {self.path}, it is loaded from the hub.")
+
+    def load(self, task) -> None:
+        if task.data_loaded:
+            return
+        entry = self.manifest['tasks'][task.metadata.name]
+        revision = task.metadata.dataset.get('revision')
+        if entry['revision'] != revision:
+            raise ValueError(f"Data bundle {self.path} has {task.metadata.name} at revision {entry['revision']}, "
+                             f"the task expects {revision}.")
+        self.check_files(entry['files'], checksums=self.verify)
+        task.dataset = self._read_node(entry['dataset'])
+        task.data_loaded = True
+
+    def _read_node(self, node: dict):
+        if node['type'] == 'dataset':
+            # Arrow files are memory-mapped
+            return load_from_disk(os.path.join(self.path, node['path']), keep_in_memory=False)
+        if node['type'] in ('dict', 'dataset_dict'):
+            items = {key: self._read_node(item) for key, item in node['items'].items()}
+            return DatasetDict(items) if node['type'] == 'dataset_dict' else items
+        if node['type'] == 'value':
+            return node['value']
+        with open(os.path.join(self.path, node['path']), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def check_files(self, files: Dict[str, dict], checksums: bool = True) -> None:
+        # sizes are always checked, SHA-256 only on request (hashing large corpora takes longer than loading them)
+        errors = []
+        for relative_path, expected in files.items():
+            file_path = os.path.join(self.path, relative_path)
+            if not os.path.exists(file_path):
+                errors.append(f"missing {relative_path}")
+            elif os.path.getsize(file_path) != expected['size']:
+                errors.append(f"size mismatch of {relative_path}")
+            elif checksums and _sha256(file_path) != expected['sha256']:
+                errors.append(f"checksum mismatch of {relative_path}")
+        if errors:
+            raise ValueError(f"Data bundle {self.path} is corrupted: {', '.join(errors)}.")
+
+    def verify_all(self) -> None:
+        for task_name, entry in self.manifest['tasks'].items():
+            self.check_files(entry['files'])
+            logging.info(f"{task_name}: {len(entry['files'])} files OK.")
+
+
+def _contains_dataset(value) -> bool:
+    if isinstance(value, Dataset):
+        return True
+    return isinstance(value, dict) and any(_contains_dataset(item) for item in value.values())
+
+
+def _safe_name(key) -> str:
+    return str(key).replace(os.sep, '_')
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def select_tasks(task_names: Optional[str]):
+    tasks = prepare_tasks()
+    if task_names is None:
+        return tasks
+    names = task_names.split(',')
+    return [task for task in tasks if task.metadata.name in names]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(asctime)s : %(message)s", level=logging.INFO)
+    logging.root.setLevel(logging.INFO)
+
+    parser = HfArgumentParser([DataBundleArgs])
+    args = parser.parse_args_into_dataclasses()[0]
+    if args.verify is not None:
+        DataBundle(args.verify).verify_all()
+        sys.exit(0)
+    if args.output_dir is None:
+        parser.error("--output_dir is required for export.")
+    DataBundle.export(select_tasks(args.tasks), args.output_dir)
@@ -0,0 +1,133 @@
+import os
+import uuid
+import sqlite3
+import hashlib
+import logging
+import numpy as np
+from time import time
+from pathlib import Path
+from typing import List, Dict, Callable
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# Vectors are stored in shards (.npy files read with memory mapping) and an SQLite index maps cache keys to
+# (shard, row). Whole shards are evicted in LRU order once the total size exceeds the limit.
+class EmbeddingCache:
+
+    _SQLITE_MAX_VARIABLES = 900
+
+    def __init__(self, cache_dir: str, max_size_gb: float = 20.0):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes: int = int(max_size_gb * 1024 ** 3)
+        self.hits: int = 0
+        self.misses: int = 0
+        self._shards: Dict[str, np.ndarray] = {}
+        self._db = sqlite3.connect(self.cache_dir / 'index.sqlite', timeout=60)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, shard TEXT, row INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_shard ON entries (shard)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS shards '
+                         '(name TEXT PRIMARY KEY, size INTEGER, last_access REAL)')
+        self._db.commit()
+
+    @staticmethod
+    def create_key(fingerprint: str, prefix: str, max_length: int, text: str) -> str:
+        key = '\x1f'.join([fingerprint, prefix, str(max_length), text_hash(text)])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def encode(self, fingerprint: str, prefix: str, max_length: int, texts: List[str],
+               encode_fn: Callable[[List[int]], np.ndarray]) -> np.ndarray:
+        # encode_fn gets positions of texts which are not in the cache and returns their embeddings
+        keys = [self.create_key(fingerprint, prefix, max_length, text) for text in texts]
+        found = self._lookup(set(keys))
+
+        missing_rows: Dict[str, int] = {}
+        missing_positions = []
+        for i, key in enumerate(keys):
+            if key not in found and key not in missing_rows:
+                missing_rows[key] = len(missing_positions)
+                missing_positions.append(i)
+        n_misses = sum(1 for key in keys if key in missing_rows)
+        self.misses += n_misses
+        self.hits += len(keys) - n_misses
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # hits are read before storing misses, which may evict shards
+        cached_vectors = {key: self._shard(shard)[row] for key, (shard, row) in found.items()}
+        self._touch({shard for shard, _ in found.values()})
+
+        new_vectors = None
+        if missing_positions:
+            new_vectors = np.asarray(encode_fn(missing_positions), dtype=np.float32)
+            self._store(list(missing_rows.keys()), new_vectors)
+
+        dim = new_vectors.shape[1] if new_vectors is not None else next(iter(cached_vectors.values())).shape[0]
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            embeddings[i] = new_vectors[missing_rows[key]] if key in missing_rows else cached_vectors[key]
+        return embeddings
+
+    def get_stats(self) -> Dict[str, float]:
+        entries, size = self._db.execute('SELECT (SELECT COUNT(*) FROM entries), '
+                                         '(SELECT COALESCE(SUM(size), 0) FROM shards)').fetchone()
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / requests, 4) if requests > 0 else 0.0,
+            'entries': entries,
+            'size_mb': round(size / 1024 ** 2, 2)
+        }
+
+    def _lookup(self, keys) -> Dict[str, tuple]:
+        keys = list(keys)
+        found = {}
+        for i in range(0, len(keys), self._SQLITE_MAX_VARIABLES):
+            chunk = keys[i:i + self._SQLITE_MAX_VARIABLES]
+            rows = self._db.execute(f'SELECT key, shard, row FROM entries WHERE key IN ({",".join("?" * len(chunk))})',
+                                    chunk).fetchall()
+            found.update({key: (shard, row) for key, shard, row in rows})
+        return {key: value for key, value in found.items() if (self.cache_dir / value[0]).exists()}
+
+    def _store(self, keys: List[str], vectors: np.ndarray) -> None:
+        shard = f'{uuid.uuid4().hex}.npy'
+        tmp_path = self.cache_dir / f'{shard}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, vectors)
+        os.replace(tmp_path, self.cache_dir / shard)
+        with self._db:
+            self._db.execute('INSERT INTO shards VALUES (?, ?, ?)', (shard, vectors.nbytes, time()))
+            self._db.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                                 [(key, shard, row) for row, key in enumerate(keys)])
+        self._evict()
+
+    def _touch(self, shards) -> None:
+        if shards:
+            with self._db:
+                self._db.executemany('UPDATE shards SET last_access = ? WHERE name = ?',
+                                     [(time(), shard) for shard in shards])
+
+    def _evict(self) -> None:
+        size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM shards').fetchone()[0]
+        if size <= self.max_size_bytes:
+            return
+        for shard, shard_size in self._db.execute('SELECT name, size FROM shards ORDER BY last_access').fetchall():
+            if size <= self.max_size_bytes:
+                break
+            with self._db:
+                self._db.execute('DELETE FROM entries WHERE shard = ?', (shard,))
+                self._db.execute('DELETE FROM shards WHERE name = ?', (shard,))
+            self._shards.pop(shard, None)
+            (self.cache_dir / shard).unlink(missing_ok=True)
+            size -= shard_size
+            logging.info(f'Evicted embedding cache shard {shard} ({shard_size} bytes).')
+
+    def _shard(self, shard: str) -> np.ndarray:
+        if shard not in self._shards:
+            self._shards[shard] = np.load(self.cache_dir / shard, mmap_mode='r')
+        return self._shards[shard]
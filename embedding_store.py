@@ -0,0 +1,72 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from pathlib import Path
+from typing import List, Iterable
+
+
+def corpus_hash(inputs: Iterable[str], chunk_size: int) -> str:
+    sha1 = hashlib.sha1(str(chunk_size).encode('utf-8'))
+    for text in inputs:
+        sha1.update(text.encode('utf-8'))
+        sha1.update(b'\x1e')
+    return sha1.hexdigest()
+
+
+class EmbeddingStore:
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.meta_path = self.path / 'meta.json'
+        self.matrix_path = self.path / 'embeddings.npy'
+        self.ids_path = self.path / 'ids.json'
+        self._matrix: np.ndarray = None
+        self.rows: int = self._load_meta().get('rows', 0)
+
+    def create(self, ids: List[str], dim: int, dtype=np.float32) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.ids_path, 'w', encoding='utf-8') as f:
+            json.dump(ids, f, ensure_ascii=False)
+        self._matrix = np.lib.format.open_memmap(self.matrix_path, mode='w+', dtype=dtype, shape=(len(ids), dim))
+        self.rows = 0
+        self._save_meta()
+
+    def append(self, embeddings: np.ndarray) -> None:
+        if self._matrix is None:
+            self._matrix = np.load(self.matrix_path, mmap_mode='r+')
+        self._matrix[self.rows:self.rows + len(embeddings)] = embeddings
+        self._matrix.flush()
+        self.rows += len(embeddings)
+        # rows are committed only after the data is flushed, so an interrupted run can continue from here
+        self._save_meta()
+
+    def is_complete(self) -> bool:
+        return self.matrix_path.exists() and self.rows == self.get_shape()[0]
+
+    def get_shape(self) -> tuple:
+        return self._load_meta()['shape']
+
+    def open(self) -> np.ndarray:
+        return np.load(self.matrix_path, mmap_mode='r')
+
+    def get_ids(self) -> List[str]:
+        with open(self.ids_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def remove(self) -> None:
+        self._matrix = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _load_meta(self) -> dict:
+        if not self.meta_path.exists():
+            return {}
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_meta(self) -> None:
+        tmp_path = self.path / 'meta.json.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rows': self.rows, 'shape': list(self._matrix.shape)}, f)
+        os.replace(tmp_path, self.meta_path)
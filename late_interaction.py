@@ -0,0 +1,137 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+from scipy.sparse import csr_matrix, vstack
+from retrieval_search import TopK
+
+retrieval_modes = {
+    # weights of dense, sparse and colbert scores
+    'dense': (1.0, 0.0, 0.0),
+    'sparse': (0.0, 1.0, 0.0),
+    'colbert': (0.0, 0.0, 1.0),
+    'hybrid': (0.4, 0.2, 0.4)
+}
+
+
+# Token vectors of many texts in one float16 matrix, rows of text i are vectors[offsets[i]:offsets[i + 1]].
+class MultiVectors:
+
+    def __init__(self, vectors: np.ndarray, offsets: np.ndarray):
+        self.vectors = vectors
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, vectors: List[np.ndarray], dim: int) -> 'MultiVectors':
+        offsets = np.zeros(len(vectors) + 1, dtype=np.int64)
+        np.cumsum([len(v) for v in vectors], out=offsets[1:])
+        flat = np.concatenate([np.asarray(v, dtype=np.float16).reshape(-1, dim) for v in vectors]) if vectors \
+            else np.empty((0, dim), dtype=np.float16)
+        return cls(flat, offsets)
+
+    @classmethod
+    def concatenate(cls, parts: List['MultiVectors']) -> 'MultiVectors':
+        offsets = [parts[0].offsets]
+        for part in parts[1:]:
+            offsets.append(part.offsets[1:] + offsets[-1][-1])
+        return cls(np.concatenate([part.vectors for part in parts]), np.concatenate(offsets))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def slice(self, start: int, end: int) -> 'MultiVectors':
+        return MultiVectors(self.vectors[self.offsets[start]:self.offsets[end]],
+                            self.offsets[start:end + 1] - self.offsets[start])
+
+    def astype(self, dtype) -> 'MultiVectors':
+        return MultiVectors(self.vectors.astype(dtype, copy=False), self.offsets)
+
+
+def late_interaction_scores(queries: MultiVectors, docs: MultiVectors) -> np.ndarray:
+    # ColBERT score: for each query token the best matching document token, averaged over query tokens
+    scores = np.zeros((len(queries), len(docs)), dtype=np.float32)
+    query_lengths, doc_lengths = queries.lengths(), docs.lengths()
+    non_empty_queries, non_empty_docs = query_lengths > 0, doc_lengths > 0
+    if not non_empty_queries.any() or not non_empty_docs.any():
+        return scores
+    # vectors converted to float32 by the caller are not copied again
+    similarities = queries.vectors.astype(np.float32, copy=False) @ docs.vectors.astype(np.float32, copy=False).T
+    best = np.maximum.reduceat(similarities, docs.offsets[:-1][non_empty_docs], axis=1)
+    sums = np.add.reduceat(best, queries.offsets[:-1][non_empty_queries], axis=0)
+    scores[np.ix_(non_empty_queries, non_empty_docs)] = sums / query_lengths[non_empty_queries, None]
+    return scores
+
+
+def lexical_weights_to_csr(lexical_weights: List[Dict[str, float]], vocab_size: int) -> csr_matrix:
+    indptr = np.zeros(len(lexical_weights) + 1, dtype=np.int64)
+    np.cumsum([len(weights) for weights in lexical_weights], out=indptr[1:])
+    indices = np.fromiter((int(token_id) for weights in lexical_weights for token_id in weights), dtype=np.int64,
+                          count=indptr[-1])
+    data = np.fromiter((weight for weights in lexical_weights for weight in weights.values()), dtype=np.float32,
+                       count=indptr[-1])
+    vectors = csr_matrix((data, indices, indptr), shape=(len(lexical_weights), vocab_size))
+    vectors.sum_duplicates()
+    return vectors
+
+
+@dataclass
+class M3Embeddings:
+    dense: np.ndarray
+    sparse: csr_matrix
+    colbert: MultiVectors
+
+    @classmethod
+    def concatenate(cls, parts: List['M3Embeddings']) -> 'M3Embeddings':
+        return cls(np.concatenate([part.dense for part in parts]),
+                   vstack([part.sparse for part in parts], format='csr'),
+                   MultiVectors.concatenate([part.colbert for part in parts]))
+
+    def __len__(self) -> int:
+        return len(self.dense)
+
+    def get_size(self) -> Dict[str, float]:
+        return {'dense_mb': self.dense.nbytes / 1024 ** 2,
+                'sparse_mb': (self.sparse.data.nbytes + self.sparse.indices.nbytes + self.sparse.indptr.nbytes)
+                / 1024 ** 2,
+                'colbert_mb': (self.colbert.vectors.nbytes + self.colbert.offsets.nbytes) / 1024 ** 2}
+
+
+# Weighted sum of dense, sparse and colbert scores computed for query batches against corpus chunks; modes with zero
+# weight are skipped. Corpus chunks are the outer loop, so float16 colbert vectors of each chunk are converted to
+# float32 once for all query batches.
+class MultiModeSearch:
+
+    def __init__(self, weights: Tuple[float, float, float], query_batch_size: int = 32, corpus_chunk_size: int = 1000):
+        self.weights = weights
+        self.query_batch_size = query_batch_size
+        self.corpus_chunk_size = corpus_chunk_size
+
+    def search(self, queries: M3Embeddings, corpus: M3Embeddings, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(top_k, len(corpus))
+        if k == 0 or len(queries) == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        dense_weight, sparse_weight, colbert_weight = self.weights
+        corpus_sparse_t = corpus.sparse.T.tocsc() if sparse_weight > 0 else None
+
+        query_colbert = queries.colbert.astype(np.float32) if colbert_weight > 0 else None
+        batches = [(start, min(start + self.query_batch_size, len(queries)))
+                   for start in range(0, len(queries), self.query_batch_size)]
+        states = [TopK(end - start, k) for start, end in batches]
+        for offset in range(0, len(corpus), self.corpus_chunk_size):
+            chunk_end = min(offset + self.corpus_chunk_size, len(corpus))
+            chunk_sparse_t = corpus_sparse_t[:, offset:chunk_end] if sparse_weight > 0 else None
+            chunk_colbert = corpus.colbert.slice(offset, chunk_end).astype(np.float32) if colbert_weight > 0 \
+                else None
+            for (start, end), state in zip(batches, states):
+                scores = np.zeros((end - start, chunk_end - offset), dtype=np.float32)
+                if dense_weight > 0:
+                    scores += dense_weight * (queries.dense[start:end] @ corpus.dense[offset:chunk_end].T)
+                if sparse_weight > 0:
+                    scores += sparse_weight * (queries.sparse[start:end] @ chunk_sparse_t).toarray()
+                if colbert_weight > 0:
+                    scores += colbert_weight * late_interaction_scores(query_colbert.slice(start, end), chunk_colbert)
+                state.update(scores, offset)
+        results = [state.get_sorted() for state in states]
+        return np.concatenate([indices for indices, _ in results]), np.concatenate([scores for _, scores in results])
@@ -0,0 +1,72 @@
+import torch
+import numpy as np
+from typing import List, Tuple, Optional, Callable
+from retrieval_search import normalize
+
+FULL = 'full'
+
+
+def parse_dimensions(dimensions: str) -> List[Optional[int]]:
+    # e.g. "64,128,256,512,full", None stands for the full dimension
+    return [None if dim.strip() == FULL else int(dim) for dim in dimensions.split(',') if dim.strip()]
+
+
+def truncate(embeddings, dim: Optional[int], chunk_size: int = 50000) -> np.ndarray:
+    if dim is None:
+        return embeddings
+    # rows are copied in chunks, so memory-mapped corpora are not loaded at full dimension
+    truncated = np.empty((len(embeddings), min(dim, embeddings.shape[1])), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_size):
+        truncated[start:start + chunk_size] = normalize(np.asarray(embeddings[start:start + chunk_size, :dim],
+                                                                   dtype=np.float32))
+    return truncated
+
+
+# Embeddings of the first pass over a task are recorded and returned in the same order in the next passes, because
+# evaluation of a task encodes the same inputs in the same order every time.
+class EncodingMemo:
+
+    def __init__(self):
+        self.outputs: List[Tuple[Optional[int], any]] = []
+        self.position = 0
+
+    def rewind(self) -> None:
+        self.position = 0
+
+    def get(self, encode_fn: Callable[[], any], size: int = None):
+        if self.position < len(self.outputs):
+            recorded_size, output = self.outputs[self.position]
+            if recorded_size != size:
+                raise ValueError(f'Encode call {self.position} differs from the first pass '
+                                 f'({size} inputs instead of {recorded_size}).')
+        else:
+            output = encode_fn()
+            self.outputs.append((size, output))
+        self.position += 1
+        return output
+
+
+class TruncatedEncoder:
+
+    def __init__(self, model, memo: EncodingMemo, dim: Optional[int]):
+        self.model = model
+        self.memo = memo
+        self.dim = dim
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def encode(self, *args, **kwargs):
+        convert_to_tensor = kwargs.pop('convert_to_tensor', False)
+        size = len(args[0]) if args and hasattr(args[0], '__len__') and not isinstance(args[0], str) else None
+
+        def encode_fn():
+            embeddings = self.model.encode(*args, **kwargs)
+            if isinstance(embeddings, torch.Tensor):
+                embeddings = embeddings.float().cpu().numpy()
+            return np.asarray(embeddings, dtype=np.float32)
+
+        embeddings = truncate(self.memo.get(encode_fn, size), self.dim)
+        return torch.from_numpy(embeddings) if convert_to_tensor else embeddings
@@ -0,0 +1,120 @@
+import os
+import resource
+import threading
+import tracemalloc
+from typing import List, Dict, Optional
+from contextlib import contextmanager
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss() -> int:
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # peak instead of current RSS where /proc is not available (ru_maxrss is in kilobytes on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def memory_limit() -> int:
+    # memory limit of the job's cgroup (v2, then v1) or physical memory of the machine
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path, 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2 ** 60:
+            return int(value)
+    return os.sysconf('SC_PHYS_PAGES') * _PAGE_SIZE
+
+
+class MemoryWindow:
+
+    def __init__(self):
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+        self.tracemalloc_peak: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, float]:
+        values = {'peak_rss_mb': self.peak_rss / 1024 ** 2,
+                  'rss_increase_mb': (self.peak_rss - self.start_rss) / 1024 ** 2}
+        if self.tracemalloc_peak is not None:
+            values['tracemalloc_peak_mb'] = self.tracemalloc_peak / 1024 ** 2
+        return values
+
+
+# Peak memory of nested code regions: a background thread samples RSS and raises the peaks of all open windows.
+# With tracemalloc, peaks of Python allocations are tracked too; tracemalloc's peak is reset when a window opens, so
+# the peak so far is first passed to all open windows.
+class MemoryMonitor:
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = 0.05
+        self.peaks: Dict[str, Dict[str, float]] = {}
+        self._windows: List[MemoryWindow] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread = None
+
+    def enable(self, interval: float = 0.05, trace_allocations: bool = False) -> None:
+        self.enabled = True
+        self.interval = interval
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def measure(self):
+        if not self.enabled:
+            yield None
+            return
+        window = MemoryWindow()
+        with self._lock:
+            self._update_tracemalloc()
+            if tracemalloc.is_tracing():
+                window.tracemalloc_peak = 0
+                tracemalloc.reset_peak()
+            self._windows.append(window)
+        try:
+            yield window
+        finally:
+            with self._lock:
+                self._update(current_rss())
+                self._update_tracemalloc()
+                self._windows.remove(window)
+
+    def record(self, category: str, window: MemoryWindow) -> None:
+        # highest values of each span category since the last reset (e.g. of all encode calls of a task)
+        peaks = self.peaks.setdefault(category, {})
+        for name, value in window.to_dict().items():
+            peaks[name] = max(peaks.get(name, 0.0), value)
+
+    def reset_peaks(self) -> Dict[str, Dict[str, float]]:
+        peaks, self.peaks = self.peaks, {}
+        return peaks
+
+    def _sample(self) -> None:
+        event = threading.Event()
+        while not event.wait(self.interval):
+            rss = current_rss()
+            with self._lock:
+                self._update(rss)
+
+    def _update(self, rss: int) -> None:
+        for window in self._windows:
+            window.peak_rss = max(window.peak_rss, rss)
+
+    def _update_tracemalloc(self) -> None:
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for window in self._windows:
+            if window.tracemalloc_peak is not None:
+                window.tracemalloc_peak = max(window.tracemalloc_peak, peak)
+
+
+memory_monitor = MemoryMonitor()
@@ -1,19 +1,51 @@
+import os
+import glob
+import json
+import uuid
+import fcntl
 import torch
+import logging
+import hashlib
 import numpy as np
-from dataclasses import dataclass
-from typing import List, Dict, Union
-from mteb.evaluation.evaluators.RetrievalEvaluator import DRESModel
+from time import time
+from dataclasses import dataclass, asdict
+from typing import Any, List, Dict, Optional, Tuple
+from mteb.types import PromptType
+from mteb._create_dataloaders import create_dataloader
+from mteb.models.model_meta import ModelMeta, ScoringFunction
+from mteb.similarity_functions import cos_sim, pairwise_cos_sim
+from torch.utils.data import DataLoader
+from datasets import Dataset
 from gensim.models import KeyedVectors, Word2Vec
+from gensim.models.fasttext import FastTextKeyedVectors
 from tqdm import tqdm
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoTokenizer, AutoModel, AutoModelForMaskedLM
+from scipy.sparse import csr_matrix, vstack
 from FlagEmbedding import BGEM3FlagModel
+from sentence_transformers import SentenceTransformer
+import onnxruntime as ort
+from embedding_cache import EmbeddingCache
+from batching import TokenBudgetBatcher
+from embedding_store import EmbeddingStore, corpus_hash
+from retrieval_search import ExactSearch, to_retrieval_results
+from matryoshka import EncodingMemo, truncate
+from sparse_retrieval import InvertedIndex
+from bm25 import BM25Index
+from tracing import tracer, ENCODE, SIMILARITY
+from late_interaction import M3Embeddings, MultiVectors, MultiModeSearch, lexical_weights_to_csr, retrieval_modes
+from precision import apply_precision, precision_context, AutocastModel
 from utils import Lemmatizer, get_first_not_none
 
+UNK = '<unk>'
+
 model_types = [
     'ST',   # Sentence-Transformer
     'T',    # Transformer
     'SWE',  # Static Word Embedding
-    'FE'    # FlagEmbedding
+    'FE',   # FlagEmbedding
+    'ONNX',   # Transformer exported to ONNX, run with ONNX Runtime
+    'SPLADE',  # Sparse term weights of a masked language model (SPLADE)
+    'BM25'     # Lexical BM25 over lemmas (retrieval tasks only)
 ]
 
 
@@ -30,6 +62,8 @@ class ModelInfo:
     path: str = ''
     max_length: int = 512
     batch_size: int = 32
+    max_tokens: int = None
+    precision: str = 'fp32'
     additional: Dict[str, any] = None
 
     def get_simple_name(self) -> str:
@@ -41,6 +75,13 @@ class ModelInfo:
     def get_additional_value(self, name, default_value=None):
         return self.additional.get(name, default_value) if self.additional is not None else default_value
 
+    def get_fingerprint(self) -> str:
+        # Fields which don't change the produced embeddings (prefixes and max_length are part of cache keys).
+        ignored = ['model_abbr', 'prefix', 'query_prefix', 'passage_prefix', 'multilingual', 'max_length',
+                   'batch_size', 'max_tokens']
+        fields = {name: value for name, value in asdict(self).items() if name not in ignored}
+        return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
 
 class KeyedVectorsModel:
 
@@ -48,54 +89,115 @@ class KeyedVectorsModel:
         self.model_info = model_info
         self.embedding: KeyedVectors = self._load_model(model_info)
         self._size: int = self.embedding.vector_size
+        self.key_to_index: Dict[str, int] = self.embedding.key_to_index
+        # Inverse norms are computed once; rows are normalized when gathered, so the matrix itself is not copied.
+        self.inv_norms: np.ndarray = self._inverse_norms(self.embedding.vectors)
+        # FastText builds vectors of out-of-vocabulary words from character n-grams.
+        self.subword_oov: bool = isinstance(self.embedding, FastTextKeyedVectors) and self.embedding.bucket > 0
+        # Out-of-vocabulary words are skipped, or mapped to the '<unk>' vector of a pruned table (oov: 'unk').
+        self.unk_id: int = self.key_to_index.get(UNK, -1) \
+            if model_info.get_additional_value('oov', 'skip') == 'unk' else -1
         self.pooling = model_info.get_additional_value('pooling')
         self.pooling_op = {'avg': self.avg_pool, 'max': self.max_pool, 'concat': self.concat_pool}[self.pooling]
-        self.lemmatizer = Lemmatizer()
+        self.lemmatizer = Lemmatizer(
+            cache_path=model_info.get_additional_value('lemma_cache', 'resources/spacy/lemma_cache.sqlite'),
+            n_process=model_info.get_additional_value('lemmatizer_n_process', 1),
+            batch_size=model_info.get_additional_value('lemmatizer_batch_size', 256))
+
+    @classmethod
+    def _load_model(cls, model_info: ModelInfo) -> KeyedVectors:
+        # Vectors are memory-mapped, so processes on one node share a single page-cached copy.
+        return KeyedVectors.load(cls._convert_model(model_info.path), mmap='r')
+
+    @staticmethod
+    def _convert_model(path: str) -> str:
+        if path.endswith(".kv"):
+            return path
+        converted_path = f"{os.path.splitext(path)[0]}.kv"
+        if os.path.exists(converted_path):
+            return converted_path
+
+        # parallel workers loading the same model wait for the one converting it
+        with open(f"{converted_path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(converted_path):
+                return converted_path
+            logging.info(f"Converting {path} to {converted_path}.")
+            text_format: bool = path.endswith(".txt")
+            model = KeyedVectors.load_word2vec_format(path, binary=False) if text_format else KeyedVectors.load(path)
+            if isinstance(model, Word2Vec):
+                model = model.wv
+            # Arrays are saved next to the main file under a name unique to this conversion; the main file is
+            # renamed last, so its presence means the conversion is complete.
+            tmp_path = f"{converted_path}.{uuid.uuid4().hex}.tmp"
+            model.save(tmp_path)
+            for filename in glob.glob(f"{glob.escape(tmp_path)}.*"):
+                os.replace(filename, converted_path + filename[len(tmp_path):])
+            os.replace(tmp_path, converted_path)
+        return converted_path
 
     @staticmethod
-    def _load_model(model_info: ModelInfo) -> KeyedVectors:
-        text_format: bool = model_info.path.endswith(".txt")
-        model = KeyedVectors.load_word2vec_format(model_info.path, binary=False) if text_format \
-            else KeyedVectors.load(model_info.path)
-        if isinstance(model, Word2Vec):
-            return model.wv
-        return model
+    def _inverse_norms(vectors) -> np.ndarray:
+        inv_norms = np.empty(len(vectors), dtype=np.float32)
+        for i in range(0, len(vectors), 100000):
+            norms = np.linalg.norm(np.asarray(vectors[i:i + 100000], dtype=np.float32), axis=1)
+            inv_norms[i:i + 100000] = 1 / np.where(norms > 0, norms, 1)
+        return inv_norms
 
     def encode(self, sentences, batch_size=32, **kwargs):
+        # Sentences are lemmatized in chunks of many lemmatizer batches, so the lemmatizer processes stay busy
+        # (spaCy starts them for each chunk) while lemmas of only one chunk are kept in memory.
+        chunk_size = 16 * self.lemmatizer.n_process * self.lemmatizer.batch_size
         vectors = []
-        for i in tqdm(range(0, len(sentences), batch_size)):
-            batch = sentences[i:i + batch_size]
-            vectors += [self._encode(lemmas) for lemmas in self.lemmatizer.get_lemmas(batch)]
-
-        vectors = np.stack(vectors, axis=0)
+        with tqdm(total=len(sentences), disable=not kwargs.get('show_progress_bar', True)) as progress_bar:
+            for chunk_start in range(0, len(sentences), chunk_size):
+                lemmas = self.lemmatizer.get_lemmas(sentences[chunk_start:chunk_start + chunk_size])
+                for i in range(0, len(lemmas), batch_size):
+                    vectors.append(self._encode(lemmas[i:i + batch_size]))
+                    progress_bar.update(len(lemmas[i:i + batch_size]))
+
+        vectors = np.concatenate(vectors, axis=0) if vectors else np.empty((0, self._size), dtype=np.float32)
         if kwargs.get('convert_to_tensor', False):
             vectors = torch.from_numpy(vectors.astype(np.float32))
         return vectors
 
-    def _encode(self, words: List[str]):
-        sentvec = [self._vocab_vector(word.lower()) for word in words]
-        sentvec = [vec for vec in sentvec if vec is not None]
-        if not sentvec:
-            sentvec.append(np.zeros(self._size))
-        return self.pooling_op(sentvec)
-
-    def _vocab_vector(self, word: str):
-        if word in self.embedding:
-            vec = self.embedding[word]
-            return self.normalize(vec)
-        else:
-            return None
+    def _encode(self, lemmas: List[List[str]]) -> np.ndarray:
+        words = [word.lower() for sentence_lemmas in lemmas for word in sentence_lemmas]
+        sentence_ids = np.repeat(np.arange(len(lemmas)), [len(sentence_lemmas) for sentence_lemmas in lemmas])
+        vectors, known = self._word_vectors(words)
+        counts = np.bincount(sentence_ids[known], minlength=len(lemmas))
+        return self.pooling_op(vectors[known], counts)
+
+    def _word_vectors(self, words: List[str]):
+        ids = np.fromiter((self.key_to_index.get(word, self.unk_id) for word in words), dtype=np.int64,
+                          count=len(words))
+        known = ids >= 0
+        vectors = np.zeros((len(words), self._size), dtype=np.float32)
+        vectors[known] = self.embedding.vectors[ids[known]] * self.inv_norms[ids[known], None]
+        if self.subword_oov:
+            for i in np.flatnonzero(~known):
+                vectors[i] = self.normalize(self.embedding[words[i]])
+            known[:] = True
+        return vectors, known
 
     @staticmethod
-    def avg_pool(sentvec):
-        return np.mean(sentvec, 0)
+    def _reduce(ufunc, vectors: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # vectors of words are grouped by sentence, counts holds the number of words in each sentence
+        pooled = np.zeros((len(counts), vectors.shape[1]), dtype=np.float32)
+        non_empty = counts > 0
+        if non_empty.any():
+            starts = np.cumsum(counts) - counts
+            pooled[non_empty] = ufunc.reduceat(vectors, starts[non_empty], axis=0)
+        return pooled
 
-    @staticmethod
-    def max_pool(sentvec):
-        return np.max(sentvec, 0)
+    def avg_pool(self, vectors, counts):
+        return self._reduce(np.add, vectors, counts) / np.maximum(counts, 1)[:, None]
 
-    def concat_pool(self, sentvec):
-        return np.hstack((self.avg_pool(sentvec), self.max_pool(sentvec)))
+    def max_pool(self, vectors, counts):
+        return self._reduce(np.maximum, vectors, counts)
+
+    def concat_pool(self, vectors, counts):
+        return np.hstack((self.avg_pool(vectors, counts), self.max_pool(vectors, counts)))
 
     @staticmethod
     def normalize(vec):
@@ -106,27 +208,80 @@ class TransformerModel:
 
     def __init__(self, model_info: ModelInfo):
         self.model_info = model_info
-        torch_type = torch.float16 if model_info.fp16 else None
-        self.tokenizer = AutoTokenizer.from_pretrained(model_info.model_name, torch_dtype=torch_type)
-        self.model = AutoModel.from_pretrained(model_info.model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_info.model_name)
+        self.model = apply_precision(AutoModel.from_pretrained(model_info.model_name).eval(), model_info.precision)
+        self.pooling = model_info.get_additional_value('pooling', 'pooler')
 
     def encode(self, sentences, batch_size=32, **kwargs):
-        embeddings = []
-        for i in tqdm(range(0, len(sentences), batch_size)):
+        # Each batch is written once into a preallocated output array.
+        embeddings = np.empty((len(sentences), self.model.config.hidden_size), dtype=np.float32)
+        for i in tqdm(range(0, len(sentences), batch_size), disable=not kwargs.get('show_progress_bar', True)):
             batch = sentences[i:i + batch_size]
-            embeddings += self._encode(batch)
+            embeddings[i:i + len(batch)] = self._encode(batch).numpy()
 
         if kwargs.get('convert_to_tensor', False):
-            embeddings = torch.stack(embeddings)
-        else:
-            embeddings = np.asarray([emb.numpy() for emb in embeddings])
+            embeddings = torch.from_numpy(embeddings)
         return embeddings
 
     def _encode(self, batch):
         inputs = self.tokenizer(batch, padding=True, truncation=True, return_tensors="pt",
                                 max_length=self.model_info.max_length)
-        with torch.no_grad():
-            return self.model(**inputs, output_hidden_states=True, return_dict=True).pooler_output
+        with torch.no_grad(), precision_context(self.model_info.precision):
+            # Only the last hidden state is kept, activations of other layers are not returned.
+            output = self.model(**inputs, return_dict=True)
+            return pool(output.last_hidden_state, inputs['attention_mask'], self.pooling,
+                        getattr(output, 'pooler_output', None), self.tokenizer.padding_side).float()
+
+
+class SpladeModel:
+
+    def __init__(self, model_info: ModelInfo):
+        self.model_info = model_info
+        self.tokenizer = AutoTokenizer.from_pretrained(model_info.model_name)
+        self.model = apply_precision(AutoModelForMaskedLM.from_pretrained(model_info.model_name).eval(),
+                                     model_info.precision)
+
+    def encode_sparse(self, sentences, batch_size=32, **kwargs) -> csr_matrix:
+        vectors = [self._encode(sentences[i:i + batch_size])
+                   for i in tqdm(range(0, len(sentences), batch_size),
+                                 disable=not kwargs.get('show_progress_bar', True))]
+        if not vectors:
+            return csr_matrix((0, self.model.config.vocab_size), dtype=np.float32)
+        return vstack(vectors, format='csr', dtype=np.float32)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        # Dense vectors over the vocabulary, for tasks which compare embeddings directly (retrieval uses sparse ones).
+        embeddings = self.encode_sparse(sentences, batch_size, **kwargs).toarray()
+        if kwargs.get('normalize_embeddings', False):
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        if kwargs.get('convert_to_tensor', False):
+            embeddings = torch.from_numpy(embeddings)
+        return embeddings
+
+    def _encode(self, batch) -> csr_matrix:
+        inputs = self.tokenizer(batch, padding=True, truncation=True, return_tensors="pt",
+                                max_length=self.model_info.max_length)
+        with torch.no_grad(), precision_context(self.model_info.precision):
+            logits = self.model(**inputs, return_dict=True).logits.float()
+        # term weights: max over tokens of log(1 + relu(logits)), computed in place on the (batch x length x vocab)
+        # logits
+        weights = torch.log1p_(torch.relu_(logits)).mul_(inputs['attention_mask'].unsqueeze(-1)).amax(dim=1)
+        return csr_matrix(weights.numpy())
+
+
+class BM25Model:
+
+    def __init__(self, model_info: ModelInfo):
+        self.model_info = model_info
+        self.k1 = model_info.get_additional_value('k1', 1.2)
+        self.b = model_info.get_additional_value('b', 0.75)
+        self.lemmatizer = Lemmatizer(
+            cache_path=model_info.get_additional_value('lemma_cache', 'resources/spacy/lemma_cache.sqlite'),
+            n_process=model_info.get_additional_value('lemmatizer_n_process', 1),
+            batch_size=model_info.get_additional_value('lemmatizer_batch_size', 256))
+
+    def tokenize(self, texts: List[str]) -> List[List[str]]:
+        return [[lemma.lower() for lemma in lemmas] for lemmas in self.lemmatizer.get_lemmas(texts)]
 
 
 class FlagModel:
@@ -148,34 +303,487 @@ class FlagModel:
             embeddings = torch.from_numpy(embeddings.astype(np.float32))
         return embeddings
 
+    def encode_m3(self, sentences, batch_size=32) -> M3Embeddings:
+        # dense, lexical and colbert outputs of the same forward pass
+        output = self.model.encode(sentences, batch_size=batch_size, max_length=self.model_info.max_length,
+                                   return_dense=True, return_sparse=True, return_colbert_vecs=True)
+        dense = np.asarray(output['dense_vecs'], dtype=np.float32)
+        return M3Embeddings(dense, lexical_weights_to_csr(output['lexical_weights'], len(self.model.tokenizer)),
+                            MultiVectors.from_list(output['colbert_vecs'], dense.shape[1]))
+
+
+def pool(last_hidden_state, attention_mask, pooling: str, pooler_output=None, padding_side: str = 'right'):
+    if pooling == 'pooler':
+        if pooler_output is None:
+            raise ValueError('Model has no pooler, use other pooling.')
+        return pooler_output
+    elif pooling == 'cls':
+        return last_hidden_state[:, 0]
+    elif pooling == 'mean':
+        mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+        return (last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+    elif pooling == 'last':
+        if padding_side == 'left':
+            return last_hidden_state[:, -1]
+        last_positions = (attention_mask.sum(dim=1) - 1).clamp(min=0)
+        return last_hidden_state[torch.arange(last_hidden_state.size(0)), last_positions]
+    raise ValueError(f'Unknown pooling: {pooling}')
+
+
+class _SentenceTransformerGraph(torch.nn.Module):
+
+    def __init__(self, model: SentenceTransformer):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model({'input_ids': input_ids, 'attention_mask': attention_mask})['sentence_embedding']
 
-class ModelWrapper:
 
-    def __init__(self, model, model_info: ModelInfo):
+class _PoolingGraph(torch.nn.Module):
+
+    def __init__(self, model, pooling: str, padding_side: str = 'right'):
+        super().__init__()
         self.model = model
+        self.pooling = pooling
+        self.padding_side = padding_side
+
+    def forward(self, input_ids, attention_mask):
+        output = self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+        return pool(output.last_hidden_state, attention_mask, self.pooling, getattr(output, 'pooler_output', None),
+                    self.padding_side)
+
+
+class OnnxModel:
+
+    def __init__(self, model_info: ModelInfo):
         self.model_info = model_info
+        # Without 'pooling', the whole sentence-transformers pipeline (pooling, dense, normalization) is exported,
+        # otherwise the Hugging Face encoder with the given pooling ('cls', 'mean', 'last' or 'pooler').
+        self.pooling = model_info.get_additional_value('pooling')
+        export_dir = self._export(model_info, self.pooling)
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        with open(os.path.join(export_dir, 'export_config.json'), 'r', encoding='utf-8') as f:
+            self.max_length = json.load(f)['max_length']
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = model_info.get_additional_value('intra_op_threads', 0)
+        options.inter_op_num_threads = model_info.get_additional_value('inter_op_threads', 0)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(os.path.join(export_dir, 'model.onnx'), options,
+                                            providers=['CPUExecutionProvider'])
+
+    @staticmethod
+    def _export(model_info: ModelInfo, pooling: str) -> str:
+        export_dir = os.path.join('resources', 'onnx', f"{model_info.model_name.replace('/', '__')}-{pooling or 'st'}")
+        if os.path.exists(os.path.join(export_dir, 'model.onnx')):
+            return export_dir
+
+        # parallel workers loading the same model wait for the one exporting it
+        os.makedirs(export_dir, exist_ok=True)
+        with open(f"{export_dir}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(os.path.join(export_dir, 'model.onnx')):
+                return export_dir
+            logging.info(f'Exporting {model_info.model_name} to ONNX ({export_dir}).')
+            if pooling is None:
+                model = SentenceTransformer(model_info.model_name, device='cpu')
+                tokenizer = model.tokenizer
+                graph = _SentenceTransformerGraph(model)
+                max_length = min(model_info.max_length, model.max_seq_length or model_info.max_length)
+            else:
+                tokenizer = AutoTokenizer.from_pretrained(model_info.model_name)
+                graph = _PoolingGraph(AutoModel.from_pretrained(model_info.model_name), pooling,
+                                      tokenizer.padding_side)
+                max_length = model_info.max_length
+
+            inputs = tokenizer(['ONNX export'], return_tensors='pt')
+            tmp_path = os.path.join(export_dir, f'model.onnx.{uuid.uuid4().hex}.tmp')
+            with torch.no_grad():
+                torch.onnx.export(graph.eval(), (inputs['input_ids'], inputs['attention_mask']), tmp_path,
+                                  input_names=['input_ids', 'attention_mask'], output_names=['embedding'],
+                                  dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                                                'attention_mask': {0: 'batch', 1: 'sequence'},
+                                                'embedding': {0: 'batch'}},
+                                  opset_version=14)
+            tokenizer.save_pretrained(export_dir)
+            with open(os.path.join(export_dir, 'export_config.json'), 'w', encoding='utf-8') as f:
+                json.dump({'model_name': model_info.model_name, 'pooling': pooling, 'max_length': max_length}, f)
+            # the model is renamed last, so its presence means the export is complete
+            os.replace(tmp_path, os.path.join(export_dir, 'model.onnx'))
+        return export_dir
 
     def encode(self, sentences, batch_size=32, **kwargs):
-        sentences = ['{}{}'.format(self.model_info.prefix, sentence) for sentence in sentences]
-        _batch_size = get_first_not_none([self.model_info.batch_size, batch_size])
-        return self.model.encode(sentences, batch_size=_batch_size, normalize_embeddings=True,
-                                 show_progress_bar=True, **kwargs)
+        embeddings = []
+        for i in tqdm(range(0, len(sentences), batch_size), disable=not kwargs.get('show_progress_bar', True)):
+            inputs = self.tokenizer(list(sentences[i:i + batch_size]), padding=True, truncation=True,
+                                    return_tensors='np', max_length=self.max_length)
+            feed = {name: inputs[name].astype(np.int64) for name in ['input_ids', 'attention_mask']}
+            embeddings.append(self.session.run(['embedding'], feed)[0])
+
+        embeddings = np.concatenate(embeddings, axis=0) if embeddings else np.empty((0, 0), dtype=np.float32)
+        if kwargs.get('normalize_embeddings', False):
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        if kwargs.get('convert_to_tensor', False):
+            embeddings = torch.from_numpy(embeddings.astype(np.float32))
+        return embeddings
+
+
+def create_model(model_info: ModelInfo):
+    if model_info.model_type == 'ST':
+        model = apply_precision(SentenceTransformer(model_info.model_name), model_info.precision)
+        return AutocastModel(model, model_info.precision) if model_info.precision == 'bf16' else model
+    elif model_info.model_type == 'T':
+        return TransformerModel(model_info)
+    elif model_info.model_type == 'SWE':
+        return KeyedVectorsModel(model_info)
+    elif model_info.model_type == 'FE':
+        return FlagModel(model_info)
+    elif model_info.model_type == 'ONNX':
+        return OnnxModel(model_info)
+    elif model_info.model_type == 'SPLADE':
+        return SpladeModel(model_info)
+    elif model_info.model_type == 'BM25':
+        return BM25Model(model_info)
+    raise ValueError(f'Unknown model type: {model_info.model_type}')
+
+
+def create_model_meta(model_info: ModelInfo) -> ModelMeta:
+    # Results are cached under the name and revision of the model, so the revision is the fingerprint of the settings
+    # which change embeddings. Local names (e.g. of static word embeddings) have no organization, so the name is
+    # not validated.
+    frameworks = {'ST': ['Sentence Transformers', 'PyTorch'], 'SWE': ['NumPy'], 'BM25': ['NumPy']}
+    return ModelMeta.model_construct(
+        loader=None, name=model_info.model_name, revision=model_info.get_fingerprint(), release_date=None,
+        languages=None, n_parameters=None, memory_usage_mb=None, max_tokens=model_info.max_length, embed_dim=None,
+        license=None, open_weights=None, public_training_code=None, public_training_data=None,
+        framework=frameworks.get(model_info.model_type, ['PyTorch']), similarity_fn_name=ScoringFunction.COSINE,
+        use_instructions=False, training_datasets=None, modalities=['text'])
+
+
+def get_tokenizer(model):
+    for candidate in [model, getattr(model, 'model', None)]:
+        tokenizer = getattr(candidate, 'tokenizer', None)
+        if tokenizer is not None:
+            return tokenizer
+    return None
+
+
+def create_batcher(model, model_info: ModelInfo) -> Optional[TokenBudgetBatcher]:
+    if model_info.max_tokens is None:
+        return None
+    tokenizer = get_tokenizer(model)
+    if tokenizer is None:
+        def length_fn(sentences):
+            return [len(sentence.split()) for sentence in sentences]
+    else:
+        def length_fn(sentences):
+            return [len(ids) for ids in tokenizer(sentences, truncation=True,
+                                                  max_length=model_info.max_length)['input_ids']]
+    return TokenBudgetBatcher(model_info.max_tokens, length_fn)
+
+
+def encode_inputs(wrapper, prefix: str, texts: List[str], inputs: List[str], batch_size: int, **kwargs):
+    model, model_info = wrapper.model, wrapper.model_info
+    if wrapper.cache is None and wrapper.batcher is None:
+        return model.encode(inputs, batch_size=batch_size, normalize_embeddings=True, **kwargs)
+
+    convert_to_tensor = kwargs.pop('convert_to_tensor', False)
+
+    def encode_positions(positions: List[int]):
+        _inputs = [inputs[i] for i in positions]
+        if wrapper.batcher is None:
+            return model.encode(_inputs, batch_size=batch_size, normalize_embeddings=True, **kwargs)
+        batch_kwargs = {**kwargs, 'show_progress_bar': False}
+        return wrapper.batcher.encode(_inputs, lambda batch: model.encode(batch, batch_size=len(batch),
+                                                                          normalize_embeddings=True, **batch_kwargs),
+                                      fixed_batch_size=batch_size)
+
+    if wrapper.cache is None:
+        embeddings = encode_positions(list(range(len(inputs))))
+    else:
+        embeddings = wrapper.cache.encode(model_info.get_fingerprint(), prefix, model_info.max_length, texts,
+                                          encode_positions)
+    if convert_to_tensor:
+        embeddings = torch.from_numpy(np.asarray(embeddings, dtype=np.float32))
+    return embeddings
+
+
+def get_input_texts(inputs) -> List[str]:
+    # mteb passes a DataLoader of batches ({'text': [...], ...}), other callers a list of texts
+    if isinstance(inputs, DataLoader):
+        return [text for batch in inputs for text in batch['text']]
+    return list(inputs)
+
+
+def format_passages(corpus: Dataset, passage_prefix: str) -> Tuple[List[str], List[str]]:
+    # texts of documents (keys of embedding caches) and inputs of the model; documents without title (no column or
+    # None) are formatted like documents with an empty title
+    titles = corpus['title'] if 'title' in corpus.column_names else [None] * len(corpus)
+    texts = ['{} {}'.format(title or '', text) for title, text in zip(titles, corpus['text'])]
+    inputs = ['{}{}'.format(passage_prefix, text).strip() for text in texts]
+    return texts, inputs
 
 
-class RetrievalModelWrapper(DRESModel):
+class ModelWrapper:
 
-    def __init__(self, model, model_info: ModelInfo, **kwargs):
-        super().__init__(model, **kwargs)
+    def __init__(self, model, model_info: ModelInfo, cache: EmbeddingCache = None):
+        self.model = model
         self.model_info = model_info
+        self.cache = cache
+        self.batcher = create_batcher(model, model_info)
+        self.table: Dict[str, int] = {}
+        self.table_embeddings: np.ndarray = None
+        # texts of encode calls, texts found in the precomputed table and (unique) texts encoded because they were not
+        self.table_stats = {'texts': 0, 'hits': 0, 'misses': 0}
+        self.mteb_model_meta = create_model_meta(model_info)
+
+    def precompute(self, sentences: List[str], batch_size=32) -> None:
+        unique_sentences = list(dict.fromkeys(sentences))
+        self.table = {sentence: i for i, sentence in enumerate(unique_sentences)}
+        self.table_embeddings = np.asarray(self._encode(unique_sentences, self.model_info.prefix, batch_size))
+
+    def encode(self, inputs, *, task_metadata=None, hf_split: str = None, hf_subset: str = None,
+               prompt_type: Optional[PromptType] = None, **kwargs):
+        sentences = get_input_texts(inputs)
+        prefix = self._get_prefix(prompt_type)
+        batch_size = kwargs.pop('batch_size', 32)
+        # precomputed embeddings are encoded with the prefix of symmetric tasks
+        if not self.table or prefix != self.model_info.prefix:
+            return self._encode(sentences, prefix, batch_size, **kwargs)
+
+        convert_to_tensor = kwargs.pop('convert_to_tensor', False)
+        missing = list(dict.fromkeys(sentence for sentence in sentences if sentence not in self.table))
+        self.table_stats['texts'] += len(sentences)
+        self.table_stats['hits'] += sum(sentence in self.table for sentence in sentences)
+        self.table_stats['misses'] += len(missing)
+        if missing:
+            missing_embeddings = np.asarray(self._encode(missing, prefix, batch_size, **kwargs))
+            missing_rows = {sentence: i for i, sentence in enumerate(missing)}
+        embeddings = np.stack([self.table_embeddings[self.table[sentence]] if sentence in self.table
+                               else missing_embeddings[missing_rows[sentence]] for sentence in sentences])
+        if convert_to_tensor:
+            embeddings = torch.from_numpy(embeddings.astype(np.float32))
+        return embeddings
+
+    def similarity(self, embeddings1, embeddings2) -> torch.Tensor:
+        return cos_sim(embeddings1, embeddings2)
+
+    def similarity_pairwise(self, embeddings1, embeddings2) -> torch.Tensor:
+        return pairwise_cos_sim(embeddings1, embeddings2)
+
+    def _get_prefix(self, prompt_type: Optional[PromptType]) -> str:
+        # queries and documents of asymmetric tasks get the prefixes used in retrieval
+        if prompt_type == PromptType.query:
+            return self.model_info.query_prefix
+        if prompt_type == PromptType.document:
+            return self.model_info.passage_prefix
+        return self.model_info.prefix
+
+    def _encode(self, sentences, prefix: str, batch_size=32, **kwargs):
+        inputs = ['{}{}'.format(prefix, sentence) for sentence in sentences]
+        _batch_size = get_first_not_none([self.model_info.batch_size, batch_size])
+        kwargs.setdefault('show_progress_bar', True)
+        return encode_inputs(self, prefix, sentences, inputs, _batch_size, **kwargs)
+
 
-    def encode_queries(self, queries: List[Union[str, Dict]], batch_size: int, **kwargs):
-        queries = ['{}{}'.format(self.model_info.query_prefix, q if isinstance(q, str) else q.get('text', ''))
-                   for q in queries]
+class RetrievalModelWrapper:
+
+    def __init__(self, model, model_info: ModelInfo, cache: EmbeddingCache = None, store_dir: str = None,
+                 chunk_size: int = 10000, resume: bool = False, search_engine=None):
+        self.model = model
+        self.model_info = model_info
+        self.cache = cache
+        self.batcher = create_batcher(model, model_info)
+        # With store_dir, corpus embeddings are streamed in chunks to a memory-mapped store on disk (with resume,
+        # an interrupted encoding continues after the last complete chunk).
+        self.store_dir = store_dir
+        self.chunk_size = chunk_size
+        self.resume = resume
+        self.stores: List[EmbeddingStore] = []
+        self.search_engine = search_engine if search_engine is not None else ExactSearch()
+        # set by the dimension sweep: embeddings are recorded in the memo and truncated to truncate_dim
+        self.memo: EncodingMemo = None
+        self.truncate_dim: int = None
+        self.mteb_model_meta = create_model_meta(model_info)
+        self.corpus: Dataset = None
+        # exact results of approximate search engines by (hf_subset, hf_split)
+        self.exact_results: Dict[Tuple[str, str], Dict[str, Dict[str, float]]] = {}
+
+    def index(self, corpus: Dataset, *, task_metadata, hf_split: str, hf_subset: str,
+              encode_kwargs: Dict[str, Any]) -> None:
+        # the corpus is encoded in search, together with the queries (so both are recorded in the memo)
+        self.corpus = corpus
+
+    def search(self, queries: Dataset, *, task_metadata, hf_split: str, hf_subset: str, top_k: int,
+               encode_kwargs: Dict[str, Any], top_ranked: Dict[str, List[str]] = None) -> Dict[str, Dict[str, float]]:
+        if self.corpus is None:
+            raise ValueError('Corpus must be indexed before searching.')
+        if top_ranked is not None:
+            raise ValueError(f'{type(self).__name__} searches the whole corpus, reranking of top-ranked documents '
+                             f'is not supported.')
+        # instructions of queries are appended as in mteb's own dataloaders
+        query_texts = get_input_texts(create_dataloader(queries, task_metadata, prompt_type=PromptType.query))
+        batch_size = get_first_not_none([self.model_info.batch_size, encode_kwargs.get('batch_size'), 32])
+        query_ids, corpus_ids = list(queries['id']), list(self.corpus['id'])
+        indices, scores = self._search(query_texts, self.corpus, top_k, batch_size)
+        exact_results = getattr(self.search_engine, 'exact_results', None)
+        if exact_results is not None:
+            # ndcg_at_10 of the exact search needs its top 10 (and one more if the query itself is ignored)
+            self.exact_results[(hf_subset, hf_split)] = to_retrieval_results(
+                query_ids, corpus_ids, exact_results[0][:, :11], exact_results[1][:, :11])
+            self.search_engine.exact_results = None
+        return to_retrieval_results(query_ids, corpus_ids, indices, scores)
+
+    def _search(self, queries: List[str], corpus: Dataset, top_k: int, batch_size: int):
+        def encode_fn():
+            with encode_span('encode queries', len(queries), batch_size):
+                query_embeddings = self.encode_queries(queries, batch_size)
+            with encode_span('encode corpus', len(corpus), batch_size):
+                corpus_embeddings = self.encode_corpus(corpus, batch_size)
+            return query_embeddings, corpus_embeddings
+
+        if self.memo is None:
+            query_embeddings, corpus_embeddings = encode_fn()
+        else:
+            query_embeddings, corpus_embeddings = self.memo.get(encode_fn, len(queries) + len(corpus))
+            query_embeddings = truncate(query_embeddings, self.truncate_dim)
+            corpus_embeddings = truncate(corpus_embeddings, self.truncate_dim)
+        with tracer.span('search', SIMILARITY, queries=len(queries), documents=len(corpus)):
+            return self.search_engine.search(query_embeddings, corpus_embeddings, top_k)
+
+    def encode_queries(self, queries: List[str], batch_size: int, **kwargs):
+        inputs = ['{}{}'.format(self.model_info.query_prefix, text) for text in queries]
         _batch_size = get_first_not_none([self.model_info.batch_size, batch_size])
-        return self.model.encode(queries, batch_size=_batch_size, normalize_embeddings=True, **kwargs)
+        return encode_inputs(self, self.model_info.query_prefix, queries, inputs, _batch_size, **kwargs)
 
-    def encode_corpus(self, corpus: List[Dict[str, str]], batch_size: int, **kwargs):
-        passages = ['{}{} {}'.format(self.model_info.passage_prefix, doc.get('title', ''),
-                                     doc['text']).strip() for doc in corpus]
+    def encode_corpus(self, corpus: Dataset, batch_size: int, **kwargs):
         _batch_size = get_first_not_none([self.model_info.batch_size, batch_size])
-        return self.model.encode(passages, batch_size=_batch_size, normalize_embeddings=True, **kwargs)
+        if self.store_dir is not None:
+            return self._encode_corpus_to_store(corpus, _batch_size, **kwargs)
+
+        texts, inputs = self._format_passages(corpus)
+        return encode_inputs(self, self.model_info.passage_prefix, texts, inputs, _batch_size, **kwargs)
+
+    def _format_passages(self, corpus: Dataset):
+        return format_passages(corpus, self.model_info.passage_prefix)
+
+    def _iter_passages(self, corpus: Dataset):
+        # formatted passages of corpus chunks, so the whole corpus is never converted to Python strings at once
+        for start in range(0, len(corpus), self.chunk_size):
+            yield self._format_passages(corpus.select(range(start, min(start + self.chunk_size, len(corpus)))))
+
+    def _encode_corpus_to_store(self, corpus: Dataset, batch_size: int, **kwargs):
+        convert_to_tensor = kwargs.pop('convert_to_tensor', False)
+        if len(corpus) == 0:
+            return np.empty((0, 0), dtype=np.float32)
+
+        key = corpus_hash(('{}{}'.format(self.model_info.passage_prefix, text)
+                           for texts, _ in self._iter_passages(corpus) for text in texts), self.chunk_size)
+        store = EmbeddingStore(os.path.join(self.store_dir, self.model_info.get_fingerprint(), key))
+        self.stores.append(store)
+        start = store.rows if self.resume and store.matrix_path.exists() else 0
+        if start > 0:
+            logging.info(f'Resuming corpus encoding from document {start} ({store.path}).')
+
+        for chunk_start in range(start, len(corpus), self.chunk_size):
+            texts, inputs = self._format_passages(
+                corpus.select(range(chunk_start, min(chunk_start + self.chunk_size, len(corpus)))))
+            embeddings = np.asarray(encode_inputs(self, self.model_info.passage_prefix, texts, inputs, batch_size,
+                                                  **kwargs), dtype=np.float32)
+            if chunk_start == 0:
+                store.create([str(doc_id) for doc_id in corpus['id']], embeddings.shape[1])
+            store.append(embeddings)
+
+        embeddings = store.open()
+        if convert_to_tensor:
+            embeddings = torch.from_numpy(np.asarray(embeddings, dtype=np.float32))
+        return embeddings
+
+    def clear_stores(self) -> None:
+        for store in self.stores:
+            store.remove()
+        self.stores = []
+
+
+# Retrieval with sparse vectors of SpladeModel: the corpus is encoded in chunks into an inverted index and queries are
+# scored by sparse dot product. Dense features (cache, corpus store, search engines) do not apply.
+class SparseRetrievalModelWrapper(RetrievalModelWrapper):
+
+    def _search(self, queries: List[str], corpus: Dataset, top_k: int, batch_size: int):
+        def encode_fn():
+            with encode_span('encode queries', len(queries), batch_size):
+                query_vectors = self.model.encode_sparse(
+                    ['{}{}'.format(self.model_info.query_prefix, text) for text in queries], batch_size)
+            with encode_span('encode corpus', len(corpus), batch_size):
+                index = InvertedIndex.from_chunks([self.model.encode_sparse(inputs, batch_size)
+                                                   for _, inputs in self._iter_passages(corpus)])
+            return query_vectors, index
+
+        start_time = time()
+        query_vectors, index = encode_fn() if self.memo is None \
+            else self.memo.get(encode_fn, len(queries) + len(corpus))
+        logging.info(f'Inverted index: {index.get_stats()}, encoding took {time() - start_time:.1f}s.')
+        start_time = time()
+        with tracer.span('search', SIMILARITY, queries=len(queries), documents=len(corpus)):
+            indices, scores = index.search(query_vectors, top_k)
+        logging.info(f'Sparse search of {len(queries)} queries took {time() - start_time:.1f}s.')
+        return indices, scores
+
+
+# Retrieval of BGE-M3 models with sparse, colbert or hybrid scores (additional value retrieval_mode). All modes use
+# embeddings of one encoding pass, colbert token vectors are kept as float16.
+class M3RetrievalModelWrapper(RetrievalModelWrapper):
+
+    def _search(self, queries: List[str], corpus: Dataset, top_k: int, batch_size: int):
+        mode = self.model_info.get_additional_value('retrieval_mode', 'dense')
+        weights = tuple(self.model_info.get_additional_value('hybrid_weights', retrieval_modes['hybrid'])) \
+            if mode == 'hybrid' else retrieval_modes[mode]
+
+        def encode_fn():
+            with encode_span('encode queries', len(queries), batch_size):
+                query_embeddings = self.model.encode_m3(
+                    ['{}{}'.format(self.model_info.query_prefix, text) for text in queries], batch_size)
+            with encode_span('encode corpus', len(corpus), batch_size):
+                corpus_embeddings = M3Embeddings.concatenate([self.model.encode_m3(inputs, batch_size)
+                                                              for _, inputs in self._iter_passages(corpus)])
+            return query_embeddings, corpus_embeddings
+
+        query_embeddings, corpus_embeddings = encode_fn() if self.memo is None \
+            else self.memo.get(encode_fn, len(queries) + len(corpus))
+        logging.info(f'BGE-M3 corpus embeddings: {corpus_embeddings.get_size()}')
+        start_time = time()
+        with tracer.span('search', SIMILARITY, queries=len(queries), documents=len(corpus)):
+            indices, scores = MultiModeSearch(weights).search(query_embeddings, corpus_embeddings, top_k)
+        logging.info(f'{mode} search of {len(queries)} queries took {time() - start_time:.1f}s.')
+        return indices, scores
+
+
+class BM25RetrievalModelWrapper(RetrievalModelWrapper):
+
+    def _search(self, queries: List[str], corpus: Dataset, top_k: int, batch_size: int):
+        _, inputs = self._format_passages(corpus)
+        start_time = time()
+        # lemmatization and indexing take the place of encoding
+        with tracer.span('index corpus', ENCODE, sentences=len(corpus)):
+            index = BM25Index(self.model.k1, self.model.b).build(self.model.tokenize(inputs))
+        build_time = time() - start_time
+        start_time = time()
+        with tracer.span('search', SIMILARITY, queries=len(queries), documents=len(corpus)):
+            indices, scores = index.search(self.model.tokenize(queries), top_k)
+        logging.info(f'BM25 index: {index.get_stats()}, build took {build_time:.1f}s, '
+                     f'{len(queries)} queries took {time() - start_time:.1f}s.')
+        return indices, scores
+
+
+def encode_span(name: str, size: int, batch_size: int):
+    return tracer.span(name, ENCODE, sentences=size, batches=-(-size // batch_size))
+
+
+def get_retrieval_wrapper_class(model_info: ModelInfo):
+    if model_info.model_type == 'BM25':
+        return BM25RetrievalModelWrapper
+    if model_info.model_type == 'SPLADE':
+        return SparseRetrievalModelWrapper
+    if model_info.model_type == 'FE' and model_info.get_additional_value('retrieval_mode', 'dense') != 'dense':
+        return M3RetrievalModelWrapper
+    return RetrievalModelWrapper
@@ -0,0 +1,69 @@
+import torch
+from time import time
+from typing import List
+from contextlib import nullcontext
+from reports import TaskReport
+
+precisions = [
+    'fp32',  # no change
+    'bf16',  # bfloat16 autocast on CPU
+    'int8'   # dynamic int8 quantization of Linear layers
+]
+
+
+def apply_precision(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+    if precision not in precisions:
+        raise ValueError(f'Unknown precision: {precision}')
+    if precision == 'int8':
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def precision_context(precision: str):
+    if precision == 'bf16':
+        return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
+    return nullcontext()
+
+
+class AutocastModel:
+
+    def __init__(self, model, precision: str):
+        self.model = model
+        self.precision = precision
+
+    @property
+    def tokenizer(self):
+        return getattr(self.model, 'tokenizer', None)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        with torch.no_grad(), precision_context(self.precision):
+            return self.model.encode(sentences, batch_size=batch_size, **kwargs)
+
+
+class PrecisionComparison(TaskReport):
+
+    def __init__(self, model_name: str, precision: str, output_dir: str, sample_size: int = 256):
+        super().__init__(model_name, output_dir, f'{precision} vs fp32', precision=precision)
+        self.sample_size = sample_size
+
+    def add(self, task_name: str, score: float, reference_score: float, texts: List[str], model,
+            reference_model) -> None:
+        texts = texts[:self.sample_size]
+        throughput = self._throughput(model, texts)
+        reference_throughput = self._throughput(reference_model, texts)
+        self.add_result(task_name, {
+            'score': score,
+            'fp32_score': reference_score,
+            'score_delta': score - reference_score,
+            'sentences_per_second': throughput,
+            'fp32_sentences_per_second': reference_throughput,
+            'speedup': throughput / reference_throughput if reference_throughput > 0 else 0.0
+        })
+
+    @staticmethod
+    def _throughput(model, texts: List[str]) -> float:
+        if not texts:
+            return 0.0
+        start_time = time()
+        model.encode(texts, batch_size=32)
+        return len(texts) / (time() - start_time)
@@ -0,0 +1,101 @@
+import logging
+import threading
+from typing import List, Dict, Optional
+from memory import current_rss, memory_limit
+from tracing import tracer, DATASET_LOAD
+
+_PENDING, _LOADING, _DONE, _TAKEN = 'pending', 'loading', 'done', 'taken'
+
+
+# Loads datasets of the next tasks in a background thread while the current task is evaluated. At most `depth` tasks
+# are loaded ahead of the task being evaluated. A load starts only if RSS of the process plus the largest RSS increase
+# of previous loads stays below the memory cap; data loaded over the cap is unloaded again. Tasks which were not
+# prefetched are taken over by the evaluation (and load their data as usual).
+class TaskPrefetcher:
+
+    def __init__(self, tasks: List, depth: int = 1, memory_cap_gb: Optional[float] = None,
+                 poll_interval: float = 1.0):
+        self.tasks = tasks
+        self.depth = depth
+        self.memory_cap = int(memory_cap_gb * 1024 ** 3) if memory_cap_gb is not None else int(memory_limit() * 0.8)
+        self.poll_interval = poll_interval
+        self.stats = {'prefetched': 0, 'skipped': 0, 'unloaded': 0, 'failed': 0}
+        self._states: Dict[str, str] = {task.metadata.name: _PENDING for task in tasks}
+        self._loaded = {task.metadata.name: threading.Event() for task in tasks}
+        self._slots = threading.Semaphore(depth + 1)  # the evaluated task and `depth` tasks ahead
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._largest_load = 0
+        self._thread = threading.Thread(target=self._prefetch, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._slots.release()
+        self._thread.join()
+        logging.info(f"Prefetch stats: {self.stats}")
+
+    def wait(self, task) -> None:
+        # called before the task is evaluated: waits for a running load or takes the task over
+        name = task.metadata.name
+        with self._lock:
+            if self._states[name] == _PENDING:
+                self._states[name] = _TAKEN
+                return
+        self._loaded[name].wait()
+
+    def release(self, task) -> None:
+        # called after the task is evaluated: frees its data and its slot for the next prefetch
+        if task.data_loaded:
+            task.unload_data()
+        self._slots.release()
+
+    def _prefetch(self) -> None:
+        for task in self.tasks:
+            name = task.metadata.name
+            self._slots.acquire()
+            if self._stop.is_set():
+                return
+            if not self._wait_for_memory(name):
+                self.stats['skipped'] += 1
+                continue
+            with self._lock:
+                if self._states[name] != _PENDING:
+                    continue
+                self._states[name] = _LOADING
+            try:
+                self._load(task)
+            finally:
+                self._states[name] = _DONE
+                self._loaded[name].set()
+
+    def _wait_for_memory(self, name: str) -> bool:
+        while current_rss() + self._largest_load > self.memory_cap:
+            with self._lock:
+                if self._states[name] != _PENDING or self._stop.is_set():
+                    return False
+            self._stop.wait(self.poll_interval)
+        return True
+
+    def _load(self, task) -> None:
+        if task.data_loaded:
+            return
+        start_rss = current_rss()
+        try:
+            with tracer.span("prefetch data", DATASET_LOAD, task=task.metadata.name):
+                task.load_data()
+        except Exception as e:
+            # the evaluation loads the data again and reports the error
+            logging.warning(f"Prefetching {task.metadata.name} failed: {e}")
+            self.stats['failed'] += 1
+            return
+        self._largest_load = max(self._largest_load, current_rss() - start_rss)
+        if current_rss() > self.memory_cap:
+            logging.warning(f"Prefetched {task.metadata.name} exceeds the memory cap "
+                            f"({current_rss() / 1024 ** 3:.1f} > {self.memory_cap / 1024 ** 3:.1f} GB), unloading.")
+            task.unload_data()
+            self.stats['unloaded'] += 1
+            return
+        self.stats['prefetched'] += 1
@@ -0,0 +1,188 @@
+import torch
+import numpy as np
+from typing import Dict, Tuple
+from retrieval_search import TopK
+from reports import TaskReport
+
+quantization_modes = [
+    'int8',   # per-dimension scales calibrated on embeddings, scored with int8 dot product
+    'binary'  # sign bits packed into bytes, scored with Hamming similarity
+]
+
+# popcount of every byte value
+_BIT_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int32)
+
+
+class Quantizer:
+
+    def __init__(self, mode: str, calibration_size: int = 1000):
+        if mode not in quantization_modes:
+            raise ValueError(f'Unknown quantization mode: {mode}')
+        self.mode = mode
+        self.calibration_size = calibration_size
+        self.scales: np.ndarray = None
+        self.weights: np.ndarray = None
+
+    def calibrate(self, embeddings) -> None:
+        sample = np.asarray(embeddings[:self.calibration_size], dtype=np.float32)
+        self.scales = np.maximum(np.abs(sample).max(axis=0), 1e-12) / 127
+        # Codes of dimension d are x / scale_d, so the dot product needs scale_d ** 2 as the weight of dimension d.
+        # Weights are rounded to integers to keep the whole kernel in integer arithmetic.
+        squares = self.scales.astype(np.float64) ** 2
+        self.weights = np.maximum(np.round(squares / squares.max() * 127), 1).astype(np.int32)
+
+    def reset(self) -> None:
+        self.scales = None
+        self.weights = None
+
+    def quantize(self, embeddings) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.mode == 'binary':
+            return np.packbits(embeddings > 0, axis=1)
+        if self.scales is None:
+            self.calibrate(embeddings)
+        return np.clip(np.round(embeddings / self.scales), -127, 127).astype(np.int8)
+
+    def dequantize(self, codes: np.ndarray, dim: int) -> np.ndarray:
+        # values seen by the tasks that use embeddings as features (e.g. classification, clustering)
+        if self.mode == 'binary':
+            return np.unpackbits(codes, axis=1, count=dim).astype(np.float32) * 2 - 1
+        return codes.astype(np.float32) * self.scales
+
+    def similarity(self, codes1: np.ndarray, codes2: np.ndarray, dim: int) -> np.ndarray:
+        if self.mode == 'binary':
+            return hamming_similarity(codes1, codes2, dim)
+        return int8_dot(codes1, codes2, self.weights)
+
+    def similarity_pairwise(self, codes1: np.ndarray, codes2: np.ndarray, dim: int) -> np.ndarray:
+        if self.mode == 'binary':
+            return dim - 2 * _BIT_COUNTS[np.bitwise_xor(codes1, codes2)].sum(axis=1)
+        return (codes1.astype(np.int64) * self.weights * codes2.astype(np.int64)).sum(axis=1)
+
+    def nbytes(self, n: int, dim: int) -> int:
+        return n * ((dim + 7) // 8 if self.mode == 'binary' else dim)
+
+
+def int8_dot(codes1: np.ndarray, codes2: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # int64 accumulation: 127 * 127 * 127 per dimension overflows int32 for large dimensions
+    return (codes1.astype(np.int64) * weights) @ codes2.astype(np.int64).T
+
+
+def hamming_similarity(codes1: np.ndarray, codes2: np.ndarray, dim: int) -> np.ndarray:
+    # dot product of the +1/-1 vectors: dim - 2 * hamming distance
+    distances = np.zeros((len(codes1), len(codes2)), dtype=np.int32)
+    for byte in range(codes1.shape[1]):
+        distances += _BIT_COUNTS[np.bitwise_xor(codes1[:, byte, None], codes2[None, :, byte])]
+    return dim - 2 * distances
+
+
+class Footprint:
+
+    def __init__(self):
+        self.embeddings = 0
+        self.float32_bytes = 0
+        self.quantized_bytes = 0
+
+    def add(self, quantizer: Quantizer, n: int, dim: int) -> None:
+        self.embeddings += n
+        self.float32_bytes += n * dim * 4
+        self.quantized_bytes += quantizer.nbytes(n, dim)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {'embeddings': self.embeddings, 'float32_bytes': self.float32_bytes,
+                'quantized_bytes': self.quantized_bytes,
+                'compression': self.float32_bytes / self.quantized_bytes if self.quantized_bytes > 0 else 0.0}
+
+
+# Wraps any encoder (wrappers from models.py or models from mteb.get_model): embeddings are quantized after encoding
+# and similarities are computed on the codes. Scales of int8 are calibrated on the first embeddings of each task.
+class QuantizedEncoder:
+
+    def __init__(self, model, mode: str, calibration_size: int = 1000):
+        self.model = model
+        self.quantizer = Quantizer(mode, calibration_size)
+        self.footprint = Footprint()
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def reset(self) -> None:
+        self.quantizer.reset()
+        self.footprint = Footprint()
+
+    def encode(self, *args, **kwargs):
+        convert_to_tensor = kwargs.pop('convert_to_tensor', False)
+        embeddings = self.model.encode(*args, **kwargs)
+        if isinstance(embeddings, torch.Tensor):
+            embeddings = embeddings.float().cpu().numpy()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.footprint.add(self.quantizer, *embeddings.shape)
+        embeddings = self.quantizer.dequantize(self.quantizer.quantize(embeddings), embeddings.shape[1])
+        return torch.from_numpy(embeddings) if convert_to_tensor else embeddings
+
+    def similarity(self, embeddings1, embeddings2) -> torch.Tensor:
+        embeddings1, embeddings2 = _to_numpy(embeddings1), _to_numpy(embeddings2)
+        return torch.from_numpy(self.quantizer.similarity(self.quantizer.quantize(embeddings1),
+                                                          self.quantizer.quantize(embeddings2),
+                                                          embeddings1.shape[1]).astype(np.float32))
+
+    def similarity_pairwise(self, embeddings1, embeddings2) -> torch.Tensor:
+        embeddings1, embeddings2 = _to_numpy(embeddings1), _to_numpy(embeddings2)
+        return torch.from_numpy(self.quantizer.similarity_pairwise(self.quantizer.quantize(embeddings1),
+                                                                   self.quantizer.quantize(embeddings2),
+                                                                   embeddings1.shape[1]).astype(np.float32))
+
+
+def _to_numpy(embeddings) -> np.ndarray:
+    if isinstance(embeddings, torch.Tensor):
+        return embeddings.float().cpu().numpy()
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+# Search engine for RetrievalModelWrapper: the corpus is quantized chunk by chunk (int8 scales calibrated on its
+# first rows) and scored against quantized queries.
+class QuantizedSearch:
+
+    def __init__(self, mode: str, calibration_size: int = 1000, query_batch_size: int = 256,
+                 corpus_chunk_size: int = 50000):
+        self.quantizer = Quantizer(mode, calibration_size)
+        self.query_batch_size = query_batch_size
+        self.corpus_chunk_size = corpus_chunk_size
+        self.footprint = Footprint()
+
+    def reset(self) -> None:
+        self.footprint = Footprint()
+
+    def search(self, query_embeddings, corpus_embeddings, top_k: int,
+               score_function: str = 'cos_sim') -> Tuple[np.ndarray, np.ndarray]:
+        # embeddings are normalized by the wrappers, so both score functions are approximated by the same kernel
+        k = min(top_k, len(corpus_embeddings))
+        if k == 0 or len(query_embeddings) == 0:
+            return np.empty((len(query_embeddings), 0), dtype=np.int64), \
+                np.empty((len(query_embeddings), 0), dtype=np.float32)
+        dim = corpus_embeddings.shape[1]
+        self.quantizer.calibrate(corpus_embeddings)
+        queries = self.quantizer.quantize(query_embeddings)
+        self.footprint.add(self.quantizer, len(corpus_embeddings), dim)
+
+        states = [TopK(len(queries[start:start + self.query_batch_size]), k)
+                  for start in range(0, len(queries), self.query_batch_size)]
+        for offset in range(0, len(corpus_embeddings), self.corpus_chunk_size):
+            chunk = self.quantizer.quantize(corpus_embeddings[offset:offset + self.corpus_chunk_size])
+            for i, state in enumerate(states):
+                batch = queries[i * self.query_batch_size:(i + 1) * self.query_batch_size]
+                state.update(self.quantizer.similarity(batch, chunk, dim).astype(np.float32), offset)
+
+        results = [state.get_sorted() for state in states]
+        return np.concatenate([indices for indices, _ in results]), np.concatenate([scores for _, scores in results])
+
+
+class QuantizationReport(TaskReport):
+
+    def __init__(self, model_name: str, mode: str, output_dir: str):
+        super().__init__(model_name, output_dir, f'{mode} embeddings', mode=mode)
+
+    def add(self, task_name: str, score: float, footprint: Footprint) -> None:
+        self.add_result(task_name, {'score': score, **footprint.to_dict()})
@@ -0,0 +1,27 @@
+import os
+import json
+import logging
+from typing import Dict
+
+
+# Results of one model on each task, saved to <output_dir>/<model>.json together with the settings of the run
+# (e.g. precision, search mode).
+class TaskReport:
+
+    def __init__(self, model_name: str, output_dir: str, description: str, **settings):
+        self.model_name = model_name
+        self.output_dir = output_dir
+        self.description = description
+        self.settings = settings
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def add_result(self, task_name: str, result: Dict[str, float]) -> None:
+        self.results[task_name] = result
+        logging.info(f'{task_name} ({self.description}): {result}')
+
+    def save(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.model_name.split('/')[-1]}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'model_name': self.model_name, **self.settings, 'tasks': self.results}, f,
+                      ensure_ascii=False, indent=4)
@@ -19,6 +19,7 @@ class ResultsSummarizer:
     def __init__(self, results_dir: str, models_config_path: str):
         self._models = self._load_models(models_config_path)
         self._tasks = prepare_tasks()
+        self._results_dir = results_dir
         self._results = self._load_results(results_dir)
 
     def _load_results(self, results_dir: str):
@@ -66,8 +67,29 @@ class ResultsSummarizer:
             print(tabulate(df[['Model'] + columns_with_values], headers='keys',
                            tablefmt=table_format, showindex=False))
 
-    def _get_results_as_dataframe(self) -> pd.DataFrame:
-        df = self._results.to_dataframe().T
+    def create_dimension_table(self, dimensions: List[str], table_format: str = 'psql') -> None:
+        # results of the dimension sweep (run_evaluation.py --matryoshka_dims) are saved in <results_dir>_dim<dim>
+        dfs = []
+        for dimension in dimensions:
+            results_dir = self._results_dir if dimension == 'full' else f'{self._results_dir}_dim{dimension}'
+            df: pd.DataFrame = self._get_results_as_dataframe(self._load_results(results_dir))
+            df['Dimension'] = dimension
+            df['Average'] = self._normalize(df[tasks_names].mean(axis=1))
+            for task_type in tasks.keys():
+                df[task_type] = self._normalize(df[tasks[task_type]].mean(axis=1))
+            dfs.append(df)
+        df = pd.concat(dfs).sort_values('Idx', kind='stable')
+
+        columns_with_values = list(tasks.keys()) + ['Average']
+        for column in columns_with_values:
+            df[column] = df[column].apply(self._pad)
+
+        print('Results per embedding dimension:')
+        print(tabulate(df[['Model', 'Dimension'] + columns_with_values], headers='keys',
+                       tablefmt=table_format, showindex=False))
+
+    def _get_results_as_dataframe(self, results=None) -> pd.DataFrame:
+        df = (results if results is not None else self._results).to_dataframe().T
         df = df.rename(columns={i: t for i, t in enumerate(df.iloc[0].tolist())}).iloc[1:]
         df = df.astype('float64')
         df["Idx"] = df.index.to_series().apply(lambda m: self._models.index(m))
@@ -0,0 +1,206 @@
+import logging
+import numpy as np
+from time import time
+from typing import Tuple, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from reports import TaskReport
+
+score_functions = ['cos_sim', 'dot']
+
+
+def to_retrieval_results(query_ids: List[str], corpus_ids: List[str], indices: np.ndarray,
+                         scores: np.ndarray) -> Dict[str, Dict[str, float]]:
+    # approximate and sparse search mark missing results with -1
+    return {query_id: {corpus_ids[j]: float(score) for j, score in zip(indices[i], scores[i]) if j >= 0}
+            for i, query_id in enumerate(query_ids)}
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+class TopK:
+
+    def __init__(self, n_queries: int, k: int):
+        self.k = k
+        self.scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        self.indices = np.full((n_queries, k), -1, dtype=np.int64)
+
+    def update(self, scores: np.ndarray, offset: int) -> None:
+        # scores of queries against a corpus chunk starting at position `offset`
+        if scores.shape[1] > self.k:
+            candidates = np.argpartition(-scores, self.k - 1, axis=1)[:, :self.k]
+            scores = np.take_along_axis(scores, candidates, axis=1)
+        else:
+            candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        merged_scores = np.concatenate([self.scores, scores], axis=1)
+        merged_indices = np.concatenate([self.indices, candidates + offset], axis=1)
+        best = np.argpartition(-merged_scores, self.k - 1, axis=1)[:, :self.k]
+        self.scores = np.take_along_axis(merged_scores, best, axis=1)
+        self.indices = np.take_along_axis(merged_indices, best, axis=1)
+
+    def get_sorted(self) -> Tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(-self.scores, axis=1, kind='stable')
+        return np.take_along_axis(self.indices, order, axis=1), np.take_along_axis(self.scores, order, axis=1)
+
+
+# Exact top-k search which multiplies query batches with corpus chunks (e.g. read from a memory-mapped matrix),
+# so the full query x corpus score matrix is never materialized.
+class ExactSearch:
+
+    def __init__(self, query_batch_size: int = 256, corpus_chunk_size: int = 50000, n_threads: int = None):
+        self.query_batch_size = query_batch_size
+        self.corpus_chunk_size = corpus_chunk_size
+        self.n_threads = n_threads
+
+    def search(self, query_embeddings, corpus_embeddings, top_k: int,
+               score_function: str = 'cos_sim') -> Tuple[np.ndarray, np.ndarray]:
+        if score_function not in score_functions:
+            raise ValueError(f'Unknown score function: {score_function}')
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if score_function == 'cos_sim':
+            queries = normalize(queries)
+        k = min(top_k, len(corpus_embeddings))
+        if k == 0 or len(queries) == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        batches = [(start, min(start + self.query_batch_size, len(queries)))
+                   for start in range(0, len(queries), self.query_batch_size)]
+        states = [TopK(end - start, k) for start, end in batches]
+        with ThreadPoolExecutor(self.n_threads) as executor:
+            # Each corpus chunk is read once, query batches are scored against it in parallel threads.
+            for offset in range(0, len(corpus_embeddings), self.corpus_chunk_size):
+                chunk = np.asarray(corpus_embeddings[offset:offset + self.corpus_chunk_size], dtype=np.float32)
+                if score_function == 'cos_sim':
+                    chunk = normalize(chunk)
+
+                def score_batch(i):
+                    start, end = batches[i]
+                    states[i].update(queries[start:end] @ chunk.T, offset)
+
+                list(executor.map(score_batch, range(len(batches))))
+
+        results = [state.get_sorted() for state in states]
+        return np.concatenate([indices for indices, _ in results]), np.concatenate([scores for _, scores in results])
+
+
+# Approximate search with an inverted file index (IVF): corpus vectors are clustered with k-means (spherical for
+# cos_sim) and only vectors from the n_probes lists closest to a query are scored.
+class IVFSearch:
+
+    def __init__(self, n_lists: int = None, n_probes: int = 16, train_size: int = 100000, n_iterations: int = 10,
+                 corpus_chunk_size: int = 50000, report_recall: bool = True, seed: int = 42):
+        self.n_lists = n_lists
+        self.n_probes = n_probes
+        self.train_size = train_size
+        self.n_iterations = n_iterations
+        self.corpus_chunk_size = corpus_chunk_size
+        self.report_recall = report_recall
+        self.seed = seed
+        self.reports: List[Dict[str, float]] = []
+        # exact top-k of the last search (with report_recall), from the same embeddings as the approximate one
+        self.exact_results: Tuple[np.ndarray, np.ndarray] = None
+
+    def search(self, query_embeddings, corpus_embeddings, top_k: int,
+               score_function: str = 'cos_sim') -> Tuple[np.ndarray, np.ndarray]:
+        if score_function not in score_functions:
+            raise ValueError(f'Unknown score function: {score_function}')
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if score_function == 'cos_sim':
+            queries = normalize(queries)
+        k = min(top_k, len(corpus_embeddings))
+        if k == 0 or len(queries) == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+
+        start_time = time()
+        centroids, order, offsets = self._build(corpus_embeddings, score_function)
+        build_time = time() - start_time
+        start_time = time()
+        indices, scores = self._search(queries, corpus_embeddings, centroids, order, offsets, k, score_function)
+        search_time = time() - start_time
+
+        if self.report_recall:
+            start_time = time()
+            exact_indices, exact_scores = ExactSearch(corpus_chunk_size=self.corpus_chunk_size).search(
+                queries, corpus_embeddings, k, score_function)
+            exact_search_time = time() - start_time
+            self.exact_results = (exact_indices, exact_scores)
+            recall = np.mean([len(set(ann[ann >= 0]) & set(exact)) / len(exact)
+                              for ann, exact in zip(indices, exact_indices)])
+            self.reports.append({'k': k, 'recall': float(recall), 'n_lists': len(centroids),
+                                 'n_probes': min(self.n_probes, len(centroids)), 'build_time': build_time,
+                                 'search_time': search_time, 'exact_search_time': exact_search_time})
+            logging.info(f'IVF search: {self.reports[-1]}')
+        return indices, scores
+
+    def _build(self, corpus_embeddings, score_function: str):
+        n = len(corpus_embeddings)
+        n_lists = min(self.n_lists or max(1, int(4 * np.sqrt(n))), n)
+        rng = np.random.default_rng(self.seed)
+        sample_ids = np.sort(rng.choice(n, size=min(n, max(self.train_size, n_lists)), replace=False))
+        sample = self._prepare(corpus_embeddings[sample_ids], score_function)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.n_iterations):
+            assignment = self._assign(sample, centroids)
+            counts = np.bincount(assignment, minlength=n_lists)
+            non_empty = counts > 0
+            starts = (np.cumsum(counts) - counts)[non_empty]
+            # empty lists keep their previous centroid
+            centroids[non_empty] = np.add.reduceat(sample[np.argsort(assignment, kind='stable')], starts, axis=0) \
+                / counts[non_empty, None]
+            if score_function == 'cos_sim':
+                centroids = normalize(centroids)
+
+        assignment = np.concatenate([
+            self._assign(self._prepare(corpus_embeddings[start:start + self.corpus_chunk_size], score_function),
+                         centroids)
+            for start in range(0, n, self.corpus_chunk_size)])
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return centroids, order, offsets
+
+    def _search(self, queries: np.ndarray, corpus_embeddings, centroids: np.ndarray, order: np.ndarray,
+                offsets: np.ndarray, k: int, score_function: str) -> Tuple[np.ndarray, np.ndarray]:
+        n_probes = min(self.n_probes, len(centroids))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        probes = np.argpartition(-(queries @ centroids.T), n_probes - 1, axis=1)[:, :n_probes]
+        for i, query in enumerate(queries):
+            candidates = np.sort(np.concatenate([order[offsets[list_id]:offsets[list_id + 1]]
+                                                 for list_id in probes[i]]))
+            candidate_scores = self._prepare(corpus_embeddings[candidates], score_function) @ query
+            k_i = min(k, len(candidates))
+            if k_i == 0:
+                continue
+            best = np.argpartition(-candidate_scores, k_i - 1)[:k_i]
+            best = best[np.argsort(-candidate_scores[best], kind='stable')]
+            indices[i, :k_i] = candidates[best]
+            scores[i, :k_i] = candidate_scores[best]
+        return indices, scores
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.concatenate([np.argmax(vectors[start:start + 10000] @ centroids.T, axis=1)
+                               for start in range(0, len(vectors), 10000)])
+
+    @staticmethod
+    def _prepare(vectors, score_function: str) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return normalize(vectors) if score_function == 'cos_sim' else vectors
+
+
+class SearchReport(TaskReport):
+
+    def __init__(self, model_name: str, search_mode: str, output_dir: str):
+        super().__init__(model_name, output_dir, f'{search_mode} vs exact', search_mode=search_mode)
+
+    def add(self, task_name: str, engine_reports: List[Dict[str, float]], score: float, exact_score: float) -> None:
+        self.add_result(task_name, {
+            'recall': float(np.mean([report['recall'] for report in engine_reports])) if engine_reports else None,
+            'k': engine_reports[0]['k'] if engine_reports else None,
+            'build_time': sum(report['build_time'] for report in engine_reports),
+            'search_time': sum(report['search_time'] for report in engine_reports),
+            'exact_search_time': sum(report['exact_search_time'] for report in engine_reports),
+            'ndcg_at_10': score,
+            'exact_ndcg_at_10': exact_score,
+            'ndcg_at_10_delta': score - exact_score
+        })
@@ -1,12 +1,32 @@
+import os
+import glob
+import json
 import mteb
+import torch
 import logging
+import numpy as np
+import multiprocessing
 from time import time
-from typing import List
+from typing import List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from transformers import HfArgumentParser
-from tasks.tasks import prepare_tasks
-from dataclasses import dataclass, field
+from tasks.tasks import prepare_tasks, get_task_texts, get_fully_encoded_splits, get_retrieval_texts
+from dataclasses import dataclass, field, replace
 from datetime import timedelta
 from mteb.cache import ResultCache
+from mteb._evaluators.retrieval_metrics import calculate_retrieval_scores
+from models import ModelInfo, ModelWrapper, RetrievalModelWrapper, create_model, get_retrieval_wrapper_class
+from embedding_cache import EmbeddingCache
+from scheduling import CostModel
+from precision import PrecisionComparison
+from retrieval_search import ExactSearch, IVFSearch, SearchReport
+from quantization import QuantizedEncoder, QuantizedSearch, QuantizationReport
+from matryoshka import EncodingMemo, TruncatedEncoder, parse_dimensions
+from tracing import tracer, TracedEncoder, MODEL_LOAD, DATASET_LOAD, ENCODE
+from memory import memory_monitor
+from prefetch import TaskPrefetcher
+from data_bundle import DataBundle
+from utils import from_dict
 
 
 @dataclass
@@ -19,6 +39,132 @@ class PL_MTEBArgs:
         metadata={"help": "Path to file with models to evaluate."},
         default="configs/models.txt"
     )
+    models_config: str = field(
+        metadata={"help": "Path to JSON file with model configs (e.g. configs/by_type/word_embeddings.json). "
+                          "Models from this file are evaluated with wrappers from models.py."},
+        default=None
+    )
+    embedding_cache: str = field(
+        metadata={"help": "Directory of persistent embedding cache (used with --models_config). "
+                          "Cache is disabled if not set."},
+        default=None
+    )
+    embedding_cache_size: float = field(
+        metadata={"help": "Maximum size of embedding cache in GB."},
+        default=20.0
+    )
+    deduplicate: bool = field(
+        metadata={"help": "Encode unique texts of all non-retrieval tasks once per model before evaluation "
+                          "(used with --models_config). Tasks with cached results are skipped."},
+        default=False
+    )
+    workers: int = field(
+        metadata={"help": "Number of worker processes evaluating (model, task) jobs in parallel."},
+        default=1
+    )
+    threads_per_worker: int = field(
+        metadata={"help": "Number of torch threads in each worker process (torch default if not set)."},
+        default=None
+    )
+    results_dir: str = field(
+        metadata={"help": "Directory with historical results, used to schedule the longest tasks first."},
+        default="results"
+    )
+    corpus_store_dir: str = field(
+        metadata={"help": "Directory for memory-mapped corpus embeddings of retrieval tasks (used with "
+                          "--models_config). If set, corpora are encoded in chunks and streamed to disk, and "
+                          "--resume continues from the last complete chunk."},
+        default=None
+    )
+    corpus_chunk_size: int = field(
+        metadata={"help": "Number of corpus documents per chunk of the corpus store (and of chunked corpus "
+                          "encoding and search)."},
+        default=10000
+    )
+    resume: bool = field(
+        metadata={"help": "Continue interrupted retrieval tasks from the last complete chunk of the corpus store "
+                          "('corpus_store' if --corpus_store_dir is not set; finished tasks are always skipped)."},
+        default=False
+    )
+    search_threads: int = field(
+        metadata={"help": "Number of threads of exact top-k search in retrieval tasks (used with --models_config)."},
+        default=None
+    )
+    search_mode: str = field(
+        metadata={"help": "Search in retrieval tasks (used with --models_config): 'exact' or 'ivf' (approximate "
+                          "search with an inverted file index). IVF runs are saved separately and report recall@k "
+                          "and ndcg_at_10 change against exact search."},
+        default="exact"
+    )
+    ivf_lists: int = field(
+        metadata={"help": "Number of IVF lists (4 * sqrt(corpus size) if not set)."},
+        default=None
+    )
+    ivf_probes: int = field(
+        metadata={"help": "Number of IVF lists searched for each query."},
+        default=16
+    )
+    embedding_quantization: str = field(
+        metadata={"help": "Quantize produced embeddings to 'int8' (per-dimension scales) or 'binary' and score them "
+                          "with int8 dot product / Hamming similarity. Results are saved separately together with "
+                          "the memory footprint of embeddings in each task. Quantization is disabled if not set."},
+        default=None
+    )
+    calibration_size: int = field(
+        metadata={"help": "Number of embeddings used to calibrate int8 scales in each task."},
+        default=1000
+    )
+    matryoshka_dims: str = field(
+        metadata={"help": "Comma-separated embedding dimensions of a dimension sweep, e.g. '64,128,256,512,full'. "
+                          "Each task is encoded once at full dimension and its metrics are recomputed for embeddings "
+                          "truncated to each dimension and re-normalized (results in eval_results_dim<dim>)."},
+        default=None
+    )
+    trace: str = field(
+        metadata={"help": "Path of Chrome trace / Perfetto JSON with spans of model load, dataset load, encode and "
+                          "similarity calls. A time breakdown per task is printed at the end of the run. Tracing is "
+                          "disabled if not set."},
+        default=None
+    )
+    memory_profile: bool = field(
+        metadata={"help": "Sample RSS in the background and write peak memory of the task, its encode and similarity "
+                          "calls and of model loading into each task's results entry (key peak_memory)."},
+        default=False
+    )
+    tracemalloc: bool = field(
+        metadata={"help": "Also record peaks of Python allocations with tracemalloc (slows down evaluation)."},
+        default=False
+    )
+    memory_sample_interval: float = field(
+        metadata={"help": "Interval of RSS sampling in seconds."},
+        default=0.05
+    )
+    data_bundle: str = field(
+        metadata={"help": "Directory of a data bundle created with data_bundle.py. Tasks are loaded from its "
+                          "memory-mapped Arrow files instead of the HF hub (tasks missing from the bundle are loaded "
+                          "from the hub)."},
+        default=None
+    )
+    verify_data_bundle: bool = field(
+        metadata={"help": "Verify SHA-256 checksums of bundle files when a task is loaded (otherwise only sizes "
+                          "are checked)."},
+        default=False
+    )
+    prefetch: int = field(
+        metadata={"help": "Number of next tasks whose datasets are loaded in a background thread while the current "
+                          "task is evaluated (sequential evaluation only). Prefetching is disabled if 0."},
+        default=0
+    )
+    prefetch_memory_cap: float = field(
+        metadata={"help": "RSS in GB above which no dataset is prefetched (80% of the memory limit of the job if "
+                          "not set)."},
+        default=None
+    )
+    compare_precision: bool = field(
+        metadata={"help": "For models with precision other than fp32 (used with --models_config), also evaluate "
+                          "them in fp32 and record score delta and throughput gain of each task."},
+        default=False
+    )
 
     def load_model_names(self) -> List[str]:
         if self.model is not None:
@@ -27,20 +173,424 @@ class PL_MTEBArgs:
             with open(self.models, "r", encoding="utf-8") as file:
                 return [line.strip() for line in file if not line.startswith("#") and line.strip() != ""]
 
+    def get_model_names(self) -> List[str]:
+        if self.models_config is not None:
+            return [model_info.model_name for model_info in self.load_model_infos()]
+        return self.load_model_names()
+
+    def load_model_infos(self) -> List[ModelInfo]:
+        with open(self.models_config, "r", encoding="utf-8") as file:
+            model_infos = [from_dict(ModelInfo, model_info) for model_info in json.load(file)]
+        if self.model is not None:
+            model_infos = [model_info for model_info in model_infos if model_info.model_name == self.model]
+        return model_infos
+
 
 class PL_MTEBEvaluator:
 
     def __init__(self, args: PL_MTEBArgs):
+        if args.embedding_quantization is not None and args.search_mode != "exact":
+            logging.warning("Search mode is ignored with embedding quantization (quantized embeddings are always "
+                            "searched exhaustively).")
+            args = replace(args, search_mode="exact")
+        if args.deduplicate and args.models_config is None:
+            logging.warning("Deduplication is supported only for models from --models_config and will be skipped.")
         self.args = args
+        if args.trace is not None:
+            tracer.enable()
+        if args.memory_profile or args.tracemalloc:
+            memory_monitor.enable(args.memory_sample_interval, trace_allocations=args.tracemalloc)
+        self._model_load_memory = {}
+        self.data_bundle = DataBundle(args.data_bundle, args.verify_data_bundle) \
+            if args.data_bundle is not None else None
+        self.embedding_cache = EmbeddingCache(args.embedding_cache, args.embedding_cache_size) \
+            if args.embedding_cache is not None else None
+        # resumed corpora are read from the corpus store
+        self.corpus_store_dir = args.corpus_store_dir or ("corpus_store" if args.resume else None)
+        self._current_model = None
+        self._reference_model = None
 
     def run(self) -> None:
-        for model_name in self.args.load_model_names():
-            model = mteb.get_model(model_name)
+        if self.args.workers > 1:
+            self._run_parallel()
+        else:
+            self._run_sequential()
+
+    def _run_sequential(self) -> None:
+        for model_name in self.args.get_model_names():
+            model, model_info = self._load_model(model_name)
             logging.info(f"Evaluating model: {model_name}")
             start_time = time()
-            mteb.evaluate(model, prepare_tasks(), cache=ResultCache(cache_path="eval_results"))
+            tasks = [task for task in self._prepare_tasks() if self._supports_task(model_info, task.metadata.type)]
+            model_wrapper, retrieval_model_wrapper = self._wrap_model(model, model_info)
+            deduplicate = self.args.deduplicate and model_info is not None and model_info.model_type != "BM25"
+            if deduplicate:
+                self._precompute_embeddings(model_wrapper, model_info, tasks)
+            comparison = self._create_precision_comparison(model_name, model_info)
+            search_report = self._create_search_report(model_name, model_info)
+            quantization_report = self._create_quantization_report(model_name, model_info)
+            prefetcher = self._create_prefetcher(tasks)
+            try:
+                for task in tasks:
+                    if prefetcher is not None:
+                        prefetcher.wait(task)
+                    task_model = retrieval_model_wrapper if task.metadata.type == "Retrieval" else model_wrapper
+                    result = self._evaluate_task(model_name, model_info, task, task_model)
+                    self._clear_task_files(task_model)
+                    if comparison is not None:
+                        self._compare_precision(comparison, model, model_info, task, result)
+                    if search_report is not None and task.metadata.type == "Retrieval":
+                        self._compare_search(search_report, task, result, task_model)
+                    if quantization_report is not None:
+                        quantization_report.add(task.metadata.name, result.task_results[0].get_score(),
+                                                self._get_quantized(task_model).footprint)
+                    if prefetcher is not None:
+                        prefetcher.release(task)
+            finally:
+                if prefetcher is not None:
+                    prefetcher.stop()
+            if comparison is not None:
+                comparison.save()
+            if search_report is not None:
+                search_report.save()
+            if quantization_report is not None:
+                quantization_report.save()
+            if deduplicate:
+                self._log_deduplication_stats(model_wrapper)
             logging.info(f"Evaluating model {model_name} took {timedelta(seconds=time() - start_time)}.")
 
+        if self.embedding_cache is not None:
+            logging.info(f"Embedding cache stats: {self.embedding_cache.get_stats()}")
+        self._save_trace()
+
+    def _run_parallel(self) -> None:
+        if self.args.deduplicate:
+            logging.warning("Deduplication is not supported with multiple workers and will be skipped.")
+        if self.args.compare_precision:
+            logging.warning("Precision comparison is not supported with multiple workers and will be skipped.")
+        if self.args.search_mode != "exact":
+            logging.warning("Search report is not supported with multiple workers and will be skipped.")
+        if self.args.embedding_quantization is not None:
+            logging.warning("Quantization report is not supported with multiple workers and will be skipped.")
+        if self.args.prefetch > 0:
+            logging.warning("Prefetching is not supported with multiple workers and will be skipped.")
+        cost_model = CostModel(self.args.results_dir)
+        task_types = {task.metadata.name: task.metadata.type for task in self._prepare_tasks()}
+        model_infos = {model_info.model_name: model_info for model_info in self.args.load_model_infos()} \
+            if self.args.models_config is not None else {}
+        start_time = time()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.args.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.args,)) as executor:
+            futures = []
+            jobs = [(model_name, task_name) for model_name in self.args.get_model_names()
+                    for task_name, task_type in task_types.items()
+                    if self._supports_task(model_infos.get(model_name), task_type)]
+            for model_name, task_name, cost in cost_model.order_longest_first(jobs):
+                logging.info(f"Scheduling {model_name} / {task_name} (estimated time: {cost:.0f}s).")
+                futures.append(executor.submit(_evaluate_job, model_name, task_name))
+            for future in as_completed(futures):
+                model_name, task_name, elapsed, events = future.result()
+                tracer.events.extend(events)
+                logging.info(f"Evaluating model {model_name} on {task_name} took {timedelta(seconds=elapsed)}.")
+        logging.info(f"Parallel evaluation took {timedelta(seconds=time() - start_time)}.")
+        self._save_trace()
+
+    def evaluate_job(self, model_name: str, task_name: str) -> Tuple[str, str, float, List[dict]]:
+        if self._current_model is None or self._current_model[0] != model_name:
+            self._current_model = None  # release the previous model before loading the next one
+            model, model_info = self._load_model(model_name)
+            self._current_model = (model_name, model_info) + self._wrap_model(model, model_info)
+        _, model_info, model_wrapper, retrieval_model_wrapper = self._current_model
+        task = next(task for task in self._prepare_tasks() if task.metadata.name == task_name)
+        task_model = retrieval_model_wrapper if task.metadata.type == "Retrieval" else model_wrapper
+        start_time = time()
+        self._evaluate_task(model_name, model_info, task, task_model)
+        self._clear_task_files(task_model)
+        # spans of the job are sent to the main process, which writes the trace
+        return model_name, task_name, time() - start_time, tracer.drain()
+
+    def _prepare_tasks(self):
+        tasks = prepare_tasks()
+        if self.data_bundle is not None:
+            self.data_bundle.attach(tasks)
+        return tasks
+
+    def _evaluate_task(self, model_name: str, model_info: Optional[ModelInfo], task, task_model):
+        start_timestamp = time()
+        memory_monitor.reset_peaks()
+        with tracer.task(model_name, task.metadata.name):
+            if not task.data_loaded:
+                with tracer.span("load data", DATASET_LOAD):
+                    task.load_data()
+            self._reset_quantization(task_model)
+            memo = EncodingMemo() if self.args.matryoshka_dims is not None else None
+            result = mteb.evaluate(self._trace(self._truncate(task_model, memo, None)), task,
+                                   cache=ResultCache(cache_path=self._results_path(model_info, task)))
+            self._log_batching_stats(task.metadata.name, task_model)
+            if memo is not None:
+                self._sweep_dimensions(task, task_model, model_info, memo)
+        if memory_monitor.enabled:
+            peak_memory = {"model_load": self._model_load_memory.get(model_name), **memory_monitor.reset_peaks()}
+            logging.info(f"{task.metadata.name} peak memory: {peak_memory}")
+            self._write_peak_memory(self._results_path(model_info, task), task.metadata.name, start_timestamp,
+                                    peak_memory)
+        return result
+
+    @staticmethod
+    def _write_peak_memory(results_path: str, task_name: str, start_timestamp: float, peak_memory: dict) -> None:
+        # only results written by this evaluation (tasks with cached results are not evaluated again)
+        for path in glob.glob(os.path.join(results_path, "**", f"{task_name}.json"), recursive=True):
+            if os.path.getmtime(path) < start_timestamp:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                task_result = json.load(f)
+            task_result["peak_memory"] = peak_memory
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(task_result, f, ensure_ascii=False, indent=2)
+
+    def _load_model(self, model_name: str) -> Tuple[any, Optional[ModelInfo]]:
+        memory_monitor.reset_peaks()
+        with tracer.span("load model", MODEL_LOAD, model=model_name):
+            if self.args.models_config is not None:
+                model_info = next(model_info for model_info in self.args.load_model_infos()
+                                  if model_info.model_name == model_name)
+                model = create_model(model_info)
+            else:
+                model, model_info = mteb.get_model(model_name), None
+        if memory_monitor.enabled:
+            self._model_load_memory[model_name] = memory_monitor.reset_peaks().get(MODEL_LOAD)
+            logging.info(f"Loading {model_name} peak memory: {self._model_load_memory[model_name]}")
+        return model, model_info
+
+    def _wrap_model(self, model, model_info: Optional[ModelInfo]) -> Tuple[any, any]:
+        if model_info is None:
+            if self.args.embedding_quantization is not None:
+                model = QuantizedEncoder(model, self.args.embedding_quantization, self.args.calibration_size)
+            return model, model
+        model_wrapper = ModelWrapper(model, model_info, cache=self.embedding_cache)
+        if self.args.embedding_quantization is not None:
+            model_wrapper = QuantizedEncoder(model_wrapper, self.args.embedding_quantization,
+                                             self.args.calibration_size)
+        retrieval_wrapper_class = get_retrieval_wrapper_class(model_info)
+        return model_wrapper, \
+            retrieval_wrapper_class(model, model_info, cache=self.embedding_cache, store_dir=self.corpus_store_dir,
+                                    chunk_size=self.args.corpus_chunk_size,
+                                    resume=self.args.resume, search_engine=self._create_search_engine())
+
+    def _create_search_engine(self):
+        search_mode = self.args.search_mode
+        if self.args.embedding_quantization is not None:
+            return QuantizedSearch(self.args.embedding_quantization, self.args.calibration_size,
+                                   corpus_chunk_size=self.args.corpus_chunk_size)
+        if search_mode == "exact":
+            return ExactSearch(corpus_chunk_size=self.args.corpus_chunk_size, n_threads=self.args.search_threads)
+        if search_mode == "ivf":
+            # recall against exact search is computed only when the report is written
+            return IVFSearch(n_lists=self.args.ivf_lists, n_probes=self.args.ivf_probes,
+                             corpus_chunk_size=self.args.corpus_chunk_size, report_recall=self.args.workers == 1)
+        raise ValueError(f"Unknown search mode: {search_mode}")
+
+    def _create_prefetcher(self, tasks) -> Optional[TaskPrefetcher]:
+        if self.args.prefetch <= 0:
+            return None
+        prefetcher = TaskPrefetcher(tasks, self.args.prefetch, self.args.prefetch_memory_cap)
+        logging.info(f"Prefetching datasets of {self.args.prefetch} next task(s) "
+                     f"(memory cap: {prefetcher.memory_cap / 1024 ** 3:.1f} GB).")
+        prefetcher.start()
+        return prefetcher
+
+    @staticmethod
+    def _supports_task(model_info: Optional[ModelInfo], task_type: str) -> bool:
+        # BM25 has no embeddings, so it is evaluated only on retrieval tasks
+        return model_info is None or model_info.model_type != "BM25" or task_type == "Retrieval"
+
+    def _precompute_embeddings(self, model_wrapper: ModelWrapper, model_info: ModelInfo, tasks) -> None:
+        sentences = []
+        for task in tasks:
+            if task.metadata.type == "Retrieval":
+                continue
+            if self._has_cached_results(model_wrapper, model_info, task):
+                logging.info(f"{task.metadata.name}: results are cached, texts are not precomputed.")
+                continue
+            # texts which the task encodes: eval splits, train splits only if all their texts are encoded
+            # (classification tasks usually sample a few texts of each label)
+            task_sentences = get_task_texts(task, extra_splits=get_fully_encoded_splits(task))
+            logging.info(f"{task.metadata.name}: {len(task_sentences)} texts, {len(set(task_sentences))} unique.")
+            sentences += task_sentences
+        if not sentences:
+            return
+
+        start_time = time()
+        with tracer.span("precompute", ENCODE, sentences=len(sentences)):
+            model_wrapper.precompute(sentences)
+        self._log_batching_stats("Deduplication pass", model_wrapper)
+        logging.info(f"Precomputed {len(model_wrapper.table)} unique texts of {len(sentences)} in "
+                     f"{timedelta(seconds=time() - start_time)}.")
+
+    def _has_cached_results(self, model_wrapper: ModelWrapper, model_info: ModelInfo, task) -> bool:
+        cache = ResultCache(cache_path=self._results_path(model_info, task))
+        result = cache.load_task_result(task.metadata.name, model_wrapper.mteb_model_meta)
+        return result is not None and not result.get_missing_evaluations(task)
+
+    @staticmethod
+    def _log_deduplication_stats(model_wrapper: ModelWrapper) -> None:
+        # without deduplication, every text of the encode calls would have been encoded
+        stats = model_wrapper.table_stats
+        encoded = len(model_wrapper.table) + stats["misses"]
+        saved = 1 - encoded / stats["texts"] if stats["texts"] else 0.0
+        logging.info(f"Deduplication: {stats['hits']} of {stats['texts']} texts found in the precomputed table, "
+                     f"{stats['misses']} encoded on demand, {encoded} encoded in total ({saved:.1%} of encoding "
+                     f"saved).")
+
+    def _results_path(self, model_info: Optional[ModelInfo], task=None, dimension: int = None) -> str:
+        suffixes = [model_info.precision] if model_info is not None and model_info.precision != "fp32" else []
+        if self.args.embedding_quantization is not None:
+            suffixes.append(f"{self.args.embedding_quantization}_embeddings")
+        if model_info is not None and self.args.search_mode != "exact" and task is not None \
+                and task.metadata.type == "Retrieval":
+            suffixes.append(self.args.search_mode)
+        if dimension is not None:
+            suffixes.append(f"dim{dimension}")
+        return "_".join(["eval_results"] + suffixes)
+
+    def _create_precision_comparison(self, model_name: str,
+                                     model_info: Optional[ModelInfo]) -> Optional[PrecisionComparison]:
+        if not self.args.compare_precision or model_info is None or model_info.precision == "fp32":
+            return None
+        reference_info = replace(model_info, precision="fp32")
+        self._reference_model = (create_model(reference_info), reference_info)
+        return PrecisionComparison(model_name, model_info.precision,
+                                   os.path.join(self._results_path(model_info), "precision_comparison"))
+
+    def _compare_precision(self, comparison: PrecisionComparison, model, model_info: ModelInfo, task,
+                           result) -> None:
+        reference_model, reference_info = self._reference_model
+        reference_wrapper, reference_retrieval_wrapper = self._wrap_model(reference_model, reference_info)
+        reference_task_model = reference_retrieval_wrapper if task.metadata.type == "Retrieval" else reference_wrapper
+        reference_result = mteb.evaluate(reference_task_model, task,
+                                         cache=ResultCache(cache_path=self._results_path(reference_info, task)))
+        self._clear_task_files(reference_task_model)
+        texts = get_retrieval_texts(task)[1] if task.metadata.type == "Retrieval" else get_task_texts(task)
+        # Throughput is measured on the bare models (without embedding cache).
+        comparison.add(task.metadata.name, result.task_results[0].get_score(),
+                       reference_result.task_results[0].get_score(), texts,
+                       ModelWrapper(model, model_info), ModelWrapper(reference_model, reference_info))
+
+    def _create_search_report(self, model_name: str, model_info: Optional[ModelInfo]) -> Optional[SearchReport]:
+        if self.args.search_mode == "exact" or model_info is None:
+            return None
+        suffixes = [model_info.precision] if model_info.precision != "fp32" else []
+        output_dir = "_".join(["eval_results"] + suffixes + [self.args.search_mode])
+        return SearchReport(model_name, self.args.search_mode, os.path.join(output_dir, "search_report"))
+
+    def _compare_search(self, report: SearchReport, task, result, task_model: RetrievalModelWrapper) -> None:
+        if not task_model.exact_results:
+            logging.info(f"{task.metadata.name}: results loaded from cache, search is not compared.")
+            return
+        # mteb unloads the data after the evaluation, qrels are read again (without encoding anything)
+        loaded = task.data_loaded
+        if not loaded:
+            task.load_data()
+        exact_score = float(np.mean([self._score_exact_results(task, hf_subset, hf_split, exact_results)
+                                     for (hf_subset, hf_split), exact_results in task_model.exact_results.items()]))
+        if not loaded:
+            task.unload_data()
+        report.add(task.metadata.name, task_model.search_engine.reports, result.task_results[0].get_score(),
+                   exact_score)
+        task_model.search_engine.reports = []
+        task_model.exact_results = {}
+
+    @staticmethod
+    def _score_exact_results(task, hf_subset: str, hf_split: str, exact_results) -> float:
+        # ndcg_at_10 of the exact top-k computed by the approximate search engine, scored as mteb scores the task
+        data_split = task.dataset[hf_subset][hf_split] if hf_subset in task.dataset else task.dataset[hf_split]
+        if task.ignore_identical_ids:
+            exact_results = {query_id: {doc_id: score for doc_id, score in docs.items() if doc_id != query_id}
+                             for query_id, docs in exact_results.items()}
+        return calculate_retrieval_scores(exact_results, data_split["relevant_docs"], [10]).ndcg["NDCG@10"]
+
+    def _create_quantization_report(self, model_name: str,
+                                    model_info: Optional[ModelInfo]) -> Optional[QuantizationReport]:
+        if self.args.embedding_quantization is None:
+            return None
+        return QuantizationReport(model_name, self.args.embedding_quantization,
+                                  os.path.join(self._results_path(model_info), "quantization"))
+
+    @staticmethod
+    def _get_quantized(task_model):
+        # retrieval tasks of local models quantize in the search engine, all other tasks in the encoder
+        if isinstance(task_model, RetrievalModelWrapper):
+            return task_model.search_engine
+        return task_model
+
+    def _reset_quantization(self, task_model) -> None:
+        if self.args.embedding_quantization is not None:
+            self._get_quantized(task_model).reset()
+
+    @staticmethod
+    def _truncate(task_model, memo: Optional[EncodingMemo], dim: Optional[int]):
+        if memo is None:
+            return task_model
+        if isinstance(task_model, RetrievalModelWrapper):
+            # retrieval wrappers of local models encode queries and corpus inside search
+            task_model.memo, task_model.truncate_dim = memo, dim
+            return task_model
+        return TruncatedEncoder(task_model, memo, dim)
+
+    def _sweep_dimensions(self, task, task_model, model_info: Optional[ModelInfo], memo: EncodingMemo) -> None:
+        for dim in parse_dimensions(self.args.matryoshka_dims):
+            if dim is None:
+                continue  # the full dimension is the main evaluation of the task
+            memo.rewind()
+            start_time = time()
+            result = mteb.evaluate(self._trace(self._truncate(task_model, memo, dim)), task,
+                                   cache=ResultCache(cache_path=self._results_path(model_info, task, dimension=dim)))
+            logging.info(f"{task.metadata.name} (dim {dim}): {result.task_results[0].get_score()} "
+                         f"in {timedelta(seconds=time() - start_time)}.")
+        if isinstance(task_model, RetrievalModelWrapper):
+            task_model.memo, task_model.truncate_dim = None, None
+
+    @staticmethod
+    def _trace(task_model):
+        # retrieval wrappers of local models record their spans in search
+        if not (tracer.enabled or memory_monitor.enabled) or isinstance(task_model, RetrievalModelWrapper):
+            return task_model
+        return TracedEncoder(task_model)
+
+    def _save_trace(self) -> None:
+        if tracer.enabled:
+            tracer.save(self.args.trace)
+            logging.info(f"Trace saved to {self.args.trace}.")
+            tracer.print_breakdown()
+
+    @staticmethod
+    def _clear_task_files(task_model) -> None:
+        if isinstance(task_model, RetrievalModelWrapper):
+            task_model.clear_stores()
+
+    @staticmethod
+    def _log_batching_stats(name: str, model) -> None:
+        batcher = getattr(model, "batcher", None)
+        if batcher is not None:
+            logging.info(f"{name}: {batcher.stats}")
+            batcher.stats.reset()
+
+
+_worker_evaluator: Optional[PL_MTEBEvaluator] = None
+
+
+def _init_worker(args: PL_MTEBArgs) -> None:
+    global _worker_evaluator
+    logging.basicConfig(format="%(asctime)s : %(processName)s : %(message)s", level=logging.INFO)
+    if args.threads_per_worker is not None:
+        torch.set_num_threads(args.threads_per_worker)
+    _worker_evaluator = PL_MTEBEvaluator(args)
+
+
+def _evaluate_job(model_name: str, task_name: str) -> Tuple[str, str, float, List[dict]]:
+    return _worker_evaluator.evaluate_job(model_name, task_name)
+
 
 if __name__ == '__main__':
     logging.basicConfig(format="%(asctime)s : %(message)s", level=logging.INFO)
@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+from statistics import mean
+from typing import Dict, List, Tuple
+
+# Names of tasks in results/ (produced by older MTEB versions) which differ from the current task names.
+_historical_task_names = {
+    "8TagsClustering": "EightTagsClustering",
+    "PPC": "PpcPC"
+}
+
+
+def normalize_task_name(task_name: str) -> str:
+    task_name = task_name.replace(".v2", "").replace("HardNegatives", "")
+    return _historical_task_names.get(task_name, task_name)
+
+
+def load_evaluation_times(results_dir: str = "results") -> Dict[str, Dict[str, float]]:
+    times = {}
+    for path in Path(results_dir).glob("*/*.json"):
+        with open(path, "r", encoding="utf-8") as file:
+            results = json.load(file)
+        for split in ["test", "validation", "dev"]:
+            split_results = results.get(split)
+            if isinstance(split_results, dict) and "evaluation_time" in split_results:
+                times.setdefault(path.parent.name, {})[normalize_task_name(path.stem)] = \
+                    split_results["evaluation_time"]
+                break
+    return times
+
+
+class CostModel:
+
+    def __init__(self, results_dir: str = "results"):
+        self.times = load_evaluation_times(results_dir)
+        times_per_task = {}
+        for model_times in self.times.values():
+            for task_name, time in model_times.items():
+                times_per_task.setdefault(task_name, []).append(time)
+        self.task_times = {task_name: mean(values) for task_name, values in times_per_task.items()}
+        self.default_time = mean(self.task_times.values()) if self.task_times else 0.0
+
+    def estimate(self, model_name: str, task_name: str) -> float:
+        task_name = normalize_task_name(task_name)
+        model_times = self.times.get(model_name.split("/")[-1], {})
+        if task_name in model_times:
+            return model_times[task_name]
+        return self.task_times.get(task_name, self.default_time)
+
+    def order_longest_first(self, jobs: List[Tuple[str, str]]) -> List[Tuple[str, str, float]]:
+        # (model, task) jobs of all models, longest first; jobs with equal estimates (e.g. tasks without history)
+        # keep the order of models, so workers rarely have to switch between models
+        model_order = {model_name: i for i, model_name in enumerate(dict.fromkeys(job[0] for job in jobs))}
+        costs = [(model_name, task_name, self.estimate(model_name, task_name)) for model_name, task_name in jobs]
+        return sorted(costs, key=lambda cost: (-cost[2], model_order[cost[0]]))
@@ -0,0 +1,45 @@
+import numpy as np
+from typing import Tuple, List
+from scipy.sparse import csr_matrix, vstack
+
+
+# Inverted index of sparse corpus vectors: row t of the (term x document) CSR matrix is the posting list of term t,
+# so a query is scored only against documents in the posting lists of its terms.
+class InvertedIndex:
+
+    def __init__(self, corpus_vectors: csr_matrix):
+        self.n_documents = corpus_vectors.shape[0]
+        self.postings: csr_matrix = corpus_vectors.T.tocsr()
+        self.postings.sort_indices()
+
+    @classmethod
+    def from_chunks(cls, chunks: List[csr_matrix]) -> 'InvertedIndex':
+        return cls(vstack(chunks, format='csr', dtype=np.float32))
+
+    def get_stats(self) -> dict:
+        lengths = np.diff(self.postings.indptr)
+        return {'documents': self.n_documents, 'terms': int((lengths > 0).sum()), 'postings': int(lengths.sum()),
+                'size_mb': (self.postings.data.nbytes + self.postings.indices.nbytes +
+                            self.postings.indptr.nbytes) / 1024 ** 2}
+
+    def search(self, query_vectors: csr_matrix, top_k: int,
+               query_batch_size: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+        n_queries = query_vectors.shape[0]
+        k = min(top_k, self.n_documents)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        for start in range(0, n_queries, query_batch_size):
+            # sparse x sparse product visits only the posting lists of query terms
+            batch_scores = (query_vectors[start:start + query_batch_size] @ self.postings).tocsr()
+            for row in range(batch_scores.shape[0]):
+                row_start, row_end = batch_scores.indptr[row], batch_scores.indptr[row + 1]
+                documents = batch_scores.indices[row_start:row_end]
+                document_scores = batch_scores.data[row_start:row_end]
+                k_i = min(k, len(documents))
+                if k_i == 0:
+                    continue
+                best = np.argpartition(-document_scores, k_i - 1)[:k_i]
+                best = best[np.argsort(-document_scores[best], kind='stable')]
+                indices[start + row, :k_i] = documents[best]
+                scores[start + row, :k_i] = document_scores[best]
+        return indices, scores
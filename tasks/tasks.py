@@ -4,7 +4,9 @@ from mteb.abstasks.classification import AbsTaskClassification
 from mteb.abstasks.retrieval import AbsTaskRetrieval
 from mteb.get_tasks import MTEBTasks, _TASKS_REGISTRY
 from tasks.tasks_metadata import tasks_metadata
-from typing import List
+from typing import List, Sequence, Tuple
+from collections import Counter
+from datasets import Dataset
 
 tasks: dict[str, List[str]] = {
     "Classification": [
@@ -64,6 +66,9 @@ tasks_types_main_metric = {
 }
 
 
+text_columns = ["text", "sentences", "sentence1", "sentence2"]
+
+
 def get_main_metric(task_name) -> str:
     return tasks_types_main_metric.get(tasks_and_types.get(task_name))
 
@@ -78,6 +83,79 @@ def prepare_tasks() -> MTEBTasks:
     return MTEBTasks(_tasks)
 
 
+def get_task_texts(task, all_splits: bool = False, extra_splits: Sequence[str] = ()) -> List[str]:
+    if not task.data_loaded:
+        task.load_data()
+    texts = []
+
+    def collect(data, split=None):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                collect(value, key)
+        elif all_splits or split in task.metadata.eval_splits or split in extra_splits:
+            for column in text_columns:
+                if column in data.column_names:
+                    for value in data[column]:
+                        texts.extend(value if isinstance(value, list) else [value])
+
+    collect(task.dataset)
+    return texts
+
+
+def get_fully_encoded_splits(task) -> List[str]:
+    # Splits other than eval splits whose texts are all encoded. Classification tasks encode `samples_per_label`
+    # texts of each label from the train split, i.e. the whole split only if no label has more texts.
+    if not isinstance(task, AbsTaskClassification):
+        return []
+    if not task.data_loaded:
+        task.load_data()
+    label_counts = []
+
+    def collect(data):
+        for key, value in data.items():
+            if key == task.train_split and not isinstance(value, dict):
+                label_counts.extend(Counter(value[task.label_column_name]).values())
+            elif isinstance(value, dict):
+                collect(value)
+
+    collect(task.dataset)
+    return [task.train_split] if label_counts and max(label_counts) <= task.samples_per_label else []
+
+
+def get_retrieval_texts(task) -> Tuple[List[str], List[str]]:
+    if not task.data_loaded:
+        task.load_data()
+    queries, corpus = [], []
+
+    def collect(data):
+        for key, value in data.items():
+            if key == "queries":
+                queries.extend(value["text"])
+            elif key == "corpus":
+                corpus.extend('{} {}'.format(doc.get('title') or '', doc['text']) for doc in value)
+            elif isinstance(value, dict):
+                collect(value)
+
+    collect(task.dataset)
+    return queries, corpus
+
+
+def get_retrieval_corpora(task) -> List[Dataset]:
+    if not task.data_loaded:
+        task.load_data()
+    corpora = []
+
+    def collect(data):
+        for key, value in data.items():
+            if key == "corpus":
+                corpora.append(value)
+            elif isinstance(value, dict):
+                collect(value)
+
+    collect(task.dataset)
+    return corpora
+
+
 class WikinewsPlClusteringS2S(AbsTaskClustering):
     metadata = tasks_metadata["WikinewsPlClusteringS2S"]
 
@@ -0,0 +1,34 @@
+import math
+import numpy as np
+from bm25 import BM25Index
+
+
+def naive_bm25(documents, query, k1=1.2, b=0.75):
+    avg_length = sum(len(document) for document in documents) / len(documents)
+    scores = []
+    for document in documents:
+        score = 0.0
+        for term in set(query):
+            df = sum(term in other for other in documents)
+            tf = document.count(term)
+            if tf == 0:
+                continue
+            idf = math.log1p((len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(document) / avg_length))
+        scores.append(score)
+    return np.asarray(scores, dtype=np.float32)
+
+
+def test_repeated_query_terms_are_scored_once():
+    documents = [["kot", "śpi", "na", "kanapie"], ["pies", "biega", "pies", "szczeka"], ["kot", "i", "pies"],
+                 ["dziecko", "je", "lody"], ["kot", "kot", "kot", "mruczy"]]
+    queries = [["kot", "kot", "pies"], ["pies", "pies", "pies"], ["lody", "nieznane", "lody"], ["nieznane"]]
+
+    indices, scores = BM25Index().build(documents).search(queries, top_k=3, max_cells=4)
+
+    for query, query_indices, query_scores in zip(queries, indices, scores):
+        expected = naive_bm25(documents, query)
+        matched = query_indices >= 0
+        assert matched.sum() == min(3, (expected > 0).sum())
+        assert np.allclose(query_scores[matched], np.sort(expected)[::-1][:matched.sum()], atol=1e-6)
+        assert np.allclose(expected[query_indices[matched]], query_scores[matched], atol=1e-6)
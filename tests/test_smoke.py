@@ -0,0 +1,159 @@
+import mteb
+import zlib
+import numpy as np
+import models
+import vocabulary_pruning
+from datasets import Dataset
+from gensim.models import KeyedVectors
+from mteb.cache import ResultCache
+from mteb.types import PromptType
+from mteb.models.models_protocols import EncoderProtocol, SearchProtocol
+from models import ModelInfo, ModelWrapper, RetrievalModelWrapper
+from run_evaluation import PL_MTEBArgs, PL_MTEBEvaluator
+from vocabulary_pruning import VocabularyPruner, VocabularyPruningArgs
+
+
+# Bag of hashed character trigrams, small enough to run each task in well under a second.
+class TinyModel:
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.calls = 0
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        self.calls += 1
+        embeddings = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for j in range(len(sentence) - 2):
+                embeddings[i, zlib.crc32(sentence[j:j + 3].encode('utf-8')) % self.dim] += 1
+        if kwargs.get('normalize_embeddings', False):
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+
+def create_sts_task():
+    task = mteb.get_task("CDSC-R")
+    sentences = ["Kot śpi na kanapie.", "Pies biega po parku.", "Dziecko je lody.", "Mężczyzna czyta gazetę.",
+                 "Kobieta jedzie rowerem.", "Ptak siedzi na drzewie."]
+    pairs = [(sentence, sentence, 5.0) for sentence in sentences] + \
+            [(sentence, other, 0.0) for sentence, other in zip(sentences, sentences[1:] + sentences[:1])]
+    task.dataset = {"test": Dataset.from_dict({"sentence1": [pair[0] for pair in pairs],
+                                               "sentence2": [pair[1] for pair in pairs],
+                                               "score": [pair[2] for pair in pairs]})}
+    task.data_loaded = True
+    return task
+
+
+def test_model_wrapper_evaluates_sts_task():
+    model = TinyModel()
+    wrapper = ModelWrapper(model, ModelInfo(model_name="test/tiny-model", batch_size=4))
+    assert isinstance(wrapper, EncoderProtocol)
+
+    result = mteb.evaluate(wrapper, create_sts_task(), cache=None, show_progress_bar=False)
+
+    assert model.calls > 0
+    assert result.task_results[0].get_score() > 0.5
+
+
+def test_model_wrapper_encodes_lists_with_prefix():
+    model_info = ModelInfo(model_name="test/tiny-model", prefix="zdanie: ", query_prefix="query: ")
+    wrapper = ModelWrapper(TinyModel(), model_info)
+
+    embeddings = wrapper.encode(["Kot śpi."], batch_size=8, show_progress_bar=False)
+    query_embeddings = wrapper.encode(["Kot śpi."], prompt_type=PromptType.query)
+
+    assert embeddings.shape == (1, 64)
+    assert not np.allclose(embeddings, query_embeddings)
+
+
+def test_results_are_cached_per_model(tmp_path):
+    cache = ResultCache(cache_path=str(tmp_path))
+    first_model, second_model = TinyModel(), TinyModel(dim=32)
+    for model, name in [(first_model, "test/first-model"), (second_model, "test/second-model")]:
+        mteb.evaluate(ModelWrapper(model, ModelInfo(model_name=name)), create_sts_task(), cache=cache,
+                      show_progress_bar=False)
+
+    assert first_model.calls > 0 and second_model.calls > 0
+    assert len(list(tmp_path.glob("results/test__first-model/*/CDSC-R.json"))) == 1
+    assert len(list(tmp_path.glob("results/test__second-model/*/CDSC-R.json"))) == 1
+
+
+def test_deduplication_skips_cached_tasks_and_counts_table_hits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    evaluator = PL_MTEBEvaluator(PL_MTEBArgs(models_config="models.json", deduplicate=True))
+    model_info = ModelInfo(model_name="test/tiny-model")
+    wrapper = ModelWrapper(TinyModel(), model_info)
+    task = create_sts_task()
+
+    evaluator._precompute_embeddings(wrapper, model_info, [task])
+    mteb.evaluate(wrapper, task, cache=ResultCache(cache_path=evaluator._results_path(model_info, task)),
+                  show_progress_bar=False)
+
+    assert len(wrapper.table) == 6
+    assert wrapper.table_stats == {'texts': 24, 'hits': 24, 'misses': 0}
+
+    cached_wrapper = ModelWrapper(TinyModel(), model_info)
+    evaluator._precompute_embeddings(cached_wrapper, model_info, [create_sts_task()])
+    assert not cached_wrapper.table
+
+
+def create_retrieval_task():
+    task = mteb.get_task("SciFact-PL")
+    documents = ["Kot śpi na kanapie w salonie.", "Pies biega po parku za piłką.", "Dziecko je lody truskawkowe.",
+                 "Mężczyzna czyta poranną gazetę.", "Kobieta jedzie rowerem do pracy."]
+    queries = ["kot na kanapie", "pies w parku", "lody truskawkowe", "poranna gazeta", "rower do pracy"]
+    task.dataset = {"default": {"test": {
+        "corpus": Dataset.from_dict({"id": [f"d{i}" for i in range(len(documents))], "title": [""] * len(documents),
+                                     "text": documents}),
+        "queries": Dataset.from_dict({"id": [f"q{i}" for i in range(len(queries))], "text": queries}),
+        "relevant_docs": {f"q{i}": {f"d{i}": 1} for i in range(len(queries))},
+        "top_ranked": None}}}
+    task.data_loaded = True
+    return task
+
+
+def test_retrieval_model_wrapper_evaluates_retrieval_task():
+    model = TinyModel()
+    wrapper = RetrievalModelWrapper(model, ModelInfo(model_name="test/tiny-model", query_prefix="zapytanie: "))
+    assert isinstance(wrapper, SearchProtocol)
+
+    result = mteb.evaluate(wrapper, create_retrieval_task(), cache=None, show_progress_bar=False)
+
+    assert model.calls == 2  # queries and corpus
+    assert result.task_results[0].get_score() > 0.5
+
+
+# Lower-cased words instead of spaCy lemmas (the Polish spaCy model is downloaded on first use).
+class WordLemmatizer:
+
+    def __init__(self, *args, n_process=1, batch_size=256, **kwargs):
+        self.n_process = n_process
+        self.batch_size = batch_size
+
+    def get_lemmas(self, texts):
+        return [text.lower().split() for text in texts]
+
+
+def test_pruned_table_encodes_passages_without_title_as_full_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, "Lemmatizer", WordLemmatizer)
+    monkeypatch.setattr(vocabulary_pruning, "Lemmatizer", WordLemmatizer)
+    words = ["none", "kot", "pies", "śpi", "biega", "w", "parku", "na", "kanapie", "dom"]
+    full_table = KeyedVectors(8)
+    full_table.add_vectors(words, np.random.RandomState(0).rand(len(words), 8).astype(np.float32))
+    full_table.save(str(tmp_path / "full.kv"))
+    task = create_retrieval_task()
+    corpus = Dataset.from_dict({"id": ["d0", "d1"], "title": [None, "Pies"], "text": ["Kot śpi", "biega w parku"]})
+    task.dataset["default"]["test"]["corpus"] = corpus
+    monkeypatch.setattr(vocabulary_pruning, "prepare_tasks", lambda: [task])
+
+    model_info = ModelInfo(model_name="test/swe", model_type="SWE", path=str(tmp_path / "full.kv"),
+                           additional={"pooling": "avg"})
+    (tmp_path / "pruned").mkdir()
+    pruner = VocabularyPruner(VocabularyPruningArgs(output_dir=str(tmp_path / "pruned")))
+    pruned_info = ModelInfo(model_name="test/swe", model_type="SWE", additional={"pooling": "avg"},
+                            path=pruner.prune(model_info, pruner.collect_lemmas(model_info)))
+
+    embeddings = [RetrievalModelWrapper(models.KeyedVectorsModel(info), info).encode_corpus(
+                  corpus, batch_size=2, show_progress_bar=False) for info in [model_info, pruned_info]]
+    assert np.allclose(embeddings[0], embeddings[1])
+    assert "none" not in KeyedVectors.load(pruned_info.path).key_to_index
@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+from time import time_ns, perf_counter_ns
+from typing import List, Dict, Tuple
+from contextlib import contextmanager
+from tabulate import tabulate
+from memory import memory_monitor
+
+# span categories
+MODEL_LOAD = 'model_load'
+DATASET_LOAD = 'dataset_load'
+ENCODE = 'encode'
+SIMILARITY = 'similarity'
+TASK = 'task'
+
+
+# Spans of evaluation phases in Chrome trace format (complete events, 'ph': 'X'), which can be opened in
+# chrome://tracing or ui.perfetto.dev. Timestamps are wall-clock microseconds, so events of worker processes can be
+# merged into one trace. Disabled tracer records nothing. With the memory monitor enabled, peak memory of each span is
+# added to its args.
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.events: List[dict] = []
+        self._context: Dict[str, str] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        if not self.enabled and not memory_monitor.enabled:
+            yield
+            return
+        start_ts, start = time_ns() // 1000, perf_counter_ns()
+        with memory_monitor.measure() as window:
+            try:
+                yield
+            finally:
+                duration = (perf_counter_ns() - start) / 1000
+        if window is not None:
+            memory_monitor.record(category, window)
+            args = {**args, **window.to_dict()}
+        if self.enabled:
+            self.events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': start_ts, 'dur': duration,
+                                'pid': os.getpid(), 'tid': threading.get_ident(),
+                                'args': {**self._context, **args}})
+
+    @contextmanager
+    def task(self, model_name: str, task_name: str):
+        # spans inside are attributed to the task in the breakdown table
+        previous = self._context
+        self._context = {'model': model_name, 'task': task_name}
+        try:
+            with self.span(task_name, TASK):
+                yield
+        finally:
+            self._context = previous
+
+    def drain(self) -> List[dict]:
+        events, self.events = self.events, []
+        return events
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def breakdown(self) -> List[dict]:
+        rows: Dict[Tuple[str, str], dict] = {}
+        for event in self.events:
+            model_name = event['args'].get('model', '')
+            task_name = event['args'].get('task', '(model load)' if event['cat'] == MODEL_LOAD else '(other)')
+            row = rows.setdefault((model_name, task_name), {
+                'Model': model_name, 'Task': task_name, 'Total [s]': 0.0, 'Dataset load [s]': 0.0,
+                'Encode [s]': 0.0, 'Encode calls': 0, 'Batches': 0, 'Similarity [s]': 0.0, 'Metrics & other [s]': 0.0})
+            seconds = event['dur'] / 1e6
+            if event['cat'] in (TASK, MODEL_LOAD):
+                row['Total [s]'] += seconds
+            elif event['cat'] == DATASET_LOAD:
+                row['Dataset load [s]'] += seconds
+            elif event['cat'] == ENCODE:
+                row['Encode [s]'] += seconds
+                row['Encode calls'] += 1
+                row['Batches'] += event['args'].get('batches', 0)
+            elif event['cat'] == SIMILARITY:
+                row['Similarity [s]'] += seconds
+        for row in rows.values():
+            if row['Task'] not in ('(model load)', '(other)'):
+                row['Metrics & other [s]'] = max(row['Total [s]'] - row['Dataset load [s]'] - row['Encode [s]'] -
+                                                 row['Similarity [s]'], 0.0)
+        return list(rows.values())
+
+    def print_breakdown(self, table_format: str = 'psql') -> None:
+        rows = self.breakdown()
+        if rows:
+            print('Time breakdown per task:')
+            print(tabulate(rows, headers='keys', tablefmt=table_format, floatfmt='.2f'))
+
+
+tracer = Tracer()
+
+
+# Records a span for each encode and similarity call of the wrapped encoder (models from mteb.get_model or wrappers
+# from models.py).
+class TracedEncoder:
+
+    def __init__(self, model):
+        self.model = model
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        attribute = getattr(self.model, name)
+        if name in ('similarity', 'similarity_pairwise'):
+            def traced(*args, **kwargs):
+                with tracer.span(name, SIMILARITY):
+                    return attribute(*args, **kwargs)
+            return traced
+        return attribute
+
+    def encode(self, *args, **kwargs):
+        inputs = args[0] if args else kwargs.get('sentences', kwargs.get('inputs'))
+        if hasattr(inputs, 'dataset'):  # DataLoader
+            size, batches = len(inputs.dataset), len(inputs)
+        else:
+            size = len(inputs) if hasattr(inputs, '__len__') else 0
+            batch_size = kwargs.get('batch_size', args[1] if len(args) > 1 else 32)
+            batches = -(-size // batch_size)
+        with tracer.span('encode', ENCODE, sentences=size, batches=batches):
+            return self.model.encode(*args, **kwargs)
@@ -1,28 +1,77 @@
 from pathlib import Path
-from typing import List
+from typing import List, Dict
 import spacy
 import os
+import json
+import sqlite3
+import hashlib
 import dataclasses
 from spacy_download import load_spacy
 
 
+class LemmaCache:
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute('CREATE TABLE IF NOT EXISTS lemmas (key TEXT PRIMARY KEY, lemmas TEXT)')
+        self._db.commit()
+
+    def get(self, keys: List[str]) -> Dict[str, List[str]]:
+        found = {}
+        for i in range(0, len(keys), 900):
+            chunk = keys[i:i + 900]
+            rows = self._db.execute(f'SELECT key, lemmas FROM lemmas WHERE key IN ({",".join("?" * len(chunk))})',
+                                    chunk).fetchall()
+            found.update({key: json.loads(lemmas) for key, lemmas in rows})
+        return found
+
+    def put(self, items: Dict[str, List[str]]) -> None:
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO lemmas VALUES (?, ?)',
+                                 [(key, json.dumps(lemmas, ensure_ascii=False)) for key, lemmas in items.items()])
+
+
 class Lemmatizer:
 
-    def __init__(self, model_name='pl_core_news_sm'):
+    # Components needed to assign lemmas (the Polish lemmatizer looks up lemmas by POS and morphology).
+    required_components = ['tok2vec', 'tagger', 'morphologizer', 'attribute_ruler', 'lemmatizer']
+
+    def __init__(self, model_name='pl_core_news_sm', cache_path='resources/spacy/lemma_cache.sqlite', n_process=1,
+                 batch_size=256):
         self.nlp = self._load_model(model_name)
+        self.version = f"{self.nlp.meta['name']}-{self.nlp.meta['version']}-{spacy.__version__}"
+        self.cache = LemmaCache(cache_path) if cache_path is not None else None
+        self.n_process = n_process
+        self.batch_size = batch_size
 
     def get_lemmas(self, texts: List[str]) -> List[List[str]]:
-        docs = self.nlp.pipe(texts)
-        return [[token.lemma_ for token in doc if not token.is_punct] for doc in docs]
+        keys = [self._key(text) for text in texts]
+        lemmas = self.cache.get(list(set(keys))) if self.cache is not None else {}
+        missing = {key: text for key, text in zip(keys, texts) if key not in lemmas}
+        if missing:
+            docs = self.nlp.pipe(missing.values(), n_process=self.n_process, batch_size=self.batch_size)
+            new_lemmas = {key: [token.lemma_ for token in doc if not token.is_punct]
+                          for key, doc in zip(missing.keys(), docs)}
+            if self.cache is not None:
+                self.cache.put(new_lemmas)
+            lemmas.update(new_lemmas)
+        return [lemmas[key] for key in keys]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f'{self.version}\x1f{text}'.encode('utf-8')).hexdigest()
 
-    @staticmethod
-    def _load_model(model_name):
+    @classmethod
+    def _load_model(cls, model_name):
         path = Path(f'resources/spacy/{model_name}')
         if not path.exists():
             os.makedirs(path, exist_ok=True)
             model = load_spacy(model_name)
             model.to_disk(path)
-        return spacy.util.load_model_from_path(path, disable=['ner', 'parser'])
+        meta = spacy.util.load_meta(path / 'meta.json')
+        exclude = [name for name in meta.get('components', meta.get('pipeline', []))
+                   if name not in cls.required_components]
+        return spacy.util.load_model_from_path(path, exclude=exclude)
 
 
 def split(samples, n):
@@ -0,0 +1,92 @@
+import os
+import json
+import logging
+import numpy as np
+from typing import List, Set
+from dataclasses import dataclass, field
+from gensim.models import KeyedVectors
+from transformers import HfArgumentParser
+from models import ModelInfo, KeyedVectorsModel, UNK, format_passages
+from tasks.tasks import prepare_tasks, get_task_texts, get_retrieval_texts, get_retrieval_corpora
+from utils import Lemmatizer, from_dict
+
+
+@dataclass
+class VocabularyPruningArgs:
+    models_config: str = field(
+        metadata={"help": "Path to JSON file with configs of static word embedding models."},
+        default="configs/by_type/word_embeddings.json"
+    )
+    output_dir: str = field(
+        metadata={"help": "Directory for pruned embedding tables."},
+        default="resources/pruned"
+    )
+    dtype: str = field(
+        metadata={"help": "Type of stored vectors: float32 or float16 (lossy: halves the table, but vectors are "
+                          "rounded to about 3 significant digits)."},
+        default="float32"
+    )
+    oov: str = field(
+        metadata={"help": "OOV policy: 'skip' (ignore unknown words, as the full model does) or 'unk' "
+                          "(store the mean vector as '<unk>' and use it for unknown words)."},
+        default="skip"
+    )
+
+
+class VocabularyPruner:
+
+    def __init__(self, args: VocabularyPruningArgs):
+        self.args = args
+        self.lemmatizer = Lemmatizer()
+        self.tasks = prepare_tasks()
+
+    def run(self) -> None:
+        with open(self.args.models_config, "r", encoding="utf-8") as file:
+            model_infos = [from_dict(ModelInfo, model_info) for model_info in json.load(file)]
+        os.makedirs(self.args.output_dir, exist_ok=True)
+        for model_info in model_infos:
+            if model_info.model_type == 'SWE':
+                self.prune(model_info, self.collect_lemmas(model_info))
+
+    def collect_lemmas(self, model_info: ModelInfo) -> Set[str]:
+        # Texts are formatted by the wrappers' own functions, so they give the same lemmas as during evaluation.
+        texts: List[str] = []
+        for task in self.tasks:
+            if task.metadata.type == "Retrieval":
+                queries, _ = get_retrieval_texts(task)
+                texts += ['{}{}'.format(model_info.query_prefix, query) for query in queries]
+                for corpus in get_retrieval_corpora(task):
+                    texts += format_passages(corpus, model_info.passage_prefix)[1]
+            else:
+                texts += ['{}{}'.format(model_info.prefix, text) for text in get_task_texts(task, all_splits=True)]
+        lemmas = self.lemmatizer.get_lemmas(list(dict.fromkeys(texts)))
+        return {word.lower() for sentence_lemmas in lemmas for word in sentence_lemmas}
+
+    def prune(self, model_info: ModelInfo, lemmas: Set[str]) -> str:
+        embedding = KeyedVectorsModel._load_model(model_info)
+        # FastText vectors of words outside its vocabulary are computed from n-grams and stored as regular words.
+        subword_oov = getattr(embedding, 'bucket', 0) > 0
+        words = sorted(word for word in lemmas if word in embedding.key_to_index or subword_oov)
+        vectors = np.stack([embedding[word] for word in words]).astype(self.args.dtype) if words \
+            else np.empty((0, embedding.vector_size), dtype=self.args.dtype)
+
+        pruned = KeyedVectors(embedding.vector_size, count=0, dtype=self.args.dtype)
+        pruned.add_vectors(words, vectors)
+        if self.args.oov == 'unk':
+            pruned.add_vectors([UNK], np.asarray(embedding.vectors.mean(axis=0, keepdims=True), dtype=self.args.dtype))
+
+        path = os.path.join(self.args.output_dir, f"{model_info.get_simple_name()}.kv")
+        pruned.save(path)
+        logging.info(f"{model_info.model_name}: {len(words)} of {len(lemmas)} lemmas kept "
+                     f"({len(embedding.key_to_index)} words in full vocabulary), "
+                     f"table size {pruned.vectors.nbytes / 1024 ** 2:.1f} MB -> {path}")
+        return path
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(asctime)s : %(message)s", level=logging.INFO)
+    logging.root.setLevel(logging.INFO)
+
+    parser = HfArgumentParser([VocabularyPruningArgs])
+    args = parser.parse_args_into_dataclasses()[0]
+    VocabularyPruner(args).run()